@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletionMessageParam
+from openai.types.chat.chat_completion_system_message_param import (
+    ChatCompletionSystemMessageParam,
+)
+
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+# Rough count for the OpenAI tokenizers, good enough for a budget
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a conversation between users and an expense "
+    "tracking assistant. Update the summary with the new messages. Keep the facts "
+    "that may matter later: expenses added or edited with their ids, amounts and "
+    "categories, questions asked and their answers, and preferences stated by the "
+    "users. Answer only with the summary, in a few short paragraphs."
+)
+
+
+def estimate_tokens(message: ChatCompletionMessageParam) -> int:
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False)
+    size = len(content)
+    for tool_call in message.get("tool_calls") or []:  # type: ignore
+        size += len(json.dumps(tool_call, ensure_ascii=False))
+    return size // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def _fingerprint(message: ChatCompletionMessageParam) -> str:
+    return hashlib.sha1(
+        json.dumps(message, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def group_turns(
+    messages: list[ChatCompletionMessageParam],
+) -> list[list[ChatCompletionMessageParam]]:
+    """Split the history in units that can be dropped independently.
+
+    An assistant message with tool calls goes together with the tool messages
+    answering it. Tool messages whose assistant message is no longer in the
+    history are dropped, as the API rejects them.
+    """
+    units: list[list[ChatCompletionMessageParam]] = []
+    pending: set[str] = set()
+    for message in messages:
+        if message["role"] == "tool":
+            if message["tool_call_id"] in pending:
+                units[-1].append(message)
+                pending.discard(message["tool_call_id"])
+            continue
+        pending = {
+            tool_call["id"]
+            for tool_call in message.get("tool_calls") or []  # type: ignore
+        }
+        units.append([message])
+    return units
+
+
+@dataclass
+class Summary:
+    text: str
+    # Fingerprint of the last message included in the summary
+    last_message: str
+
+
+class ConversationContext:
+    """Builds the messages sent to the model for a chat.
+
+    The window holds the newest turns that fit in `token_budget` tokens, always
+    at least the last one, and never separates tool calls from their results.
+    Older turns are folded into a running summary per chat, which is updated in
+    a background task once `summary_batch_tokens` tokens have been left out of
+    the window, so requests never wait for it. Until the summary catches up the
+    window goes with the previous one.
+    """
+
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        token_budget: int = settings.CHAT_CONTEXT_TOKENS,
+        summary_batch_tokens: int = settings.CHAT_SUMMARY_BATCH_TOKENS,
+        model: str = "gpt-4o-mini",
+    ):
+        self.openai = openai_client
+        self.token_budget = token_budget
+        self.summary_batch_tokens = summary_batch_tokens
+        self.model = model
+        self._summaries: dict[int, Summary] = {}
+        self._summarizers: dict[int, asyncio.Task] = {}
+
+    def window(
+        self, chat_id: int, messages: list[ChatCompletionMessageParam]
+    ) -> list[ChatCompletionMessageParam]:
+        units = group_turns(messages)
+        tokens = 0
+        start = len(units)
+        while start > 0:
+            unit_tokens = sum(estimate_tokens(message) for message in units[start - 1])
+            if start < len(units) and tokens + unit_tokens > self.token_budget:
+                break
+            tokens += unit_tokens
+            start -= 1
+        window = [message for unit in units[start:] for message in unit]
+        evicted = [message for unit in units[:start] for message in unit]
+        if not evicted:
+            # Everything fits, also after the chat was cleared
+            self._summaries.pop(chat_id, None)
+            return window
+        self._maybe_summarize(chat_id, evicted)
+        summary = self._summaries.get(chat_id)
+        if summary is None:
+            return window
+        return [
+            ChatCompletionSystemMessageParam(
+                role="system",
+                content=f"Summary of the earlier conversation:\n{summary.text}",
+            )
+        ] + window
+
+    def _unsummarized(
+        self, chat_id: int, evicted: list[ChatCompletionMessageParam]
+    ) -> list[ChatCompletionMessageParam]:
+        summary = self._summaries.get(chat_id)
+        if summary is None:
+            return evicted
+        for i in range(len(evicted) - 1, -1, -1):
+            if _fingerprint(evicted[i]) == summary.last_message:
+                return evicted[i + 1 :]
+        # The last summarized message is older than the stored history
+        return evicted
+
+    def _maybe_summarize(
+        self, chat_id: int, evicted: list[ChatCompletionMessageParam]
+    ) -> None:
+        running = self._summarizers.get(chat_id)
+        if running is not None and not running.done():
+            return
+        new = self._unsummarized(chat_id, evicted)
+        if not new:
+            return
+        # The first summary is made right away, later ones in batches
+        if (
+            chat_id in self._summaries
+            and sum(estimate_tokens(message) for message in new)
+            < self.summary_batch_tokens
+        ):
+            return
+        self._summarizers[chat_id] = asyncio.create_task(self._summarize(chat_id, new))
+
+    async def _summarize(
+        self, chat_id: int, messages: list[ChatCompletionMessageParam]
+    ) -> None:
+        previous = self._summaries.get(chat_id)
+        transcript = "\n".join(
+            f"{message['role']}: {message.get('content') or ''}"
+            + "".join(
+                f"\n  called {tool_call['function']['name']}({tool_call['function']['arguments']})"
+                for tool_call in message.get("tool_calls") or []  # type: ignore
+            )
+            for message in messages
+        )
+        try:
+            with metrics.timer("openai_request_seconds", model=self.model):
+                completion = await self.openai.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {
+                            "role": "user",
+                            "content": f"Current summary:\n{previous.text if previous else '(none)'}"
+                            f"\n\nNew messages:\n{transcript}",
+                        },
+                    ],
+                )
+        except Exception as e:
+            metrics.inc("openai_errors_total", model=self.model)
+            logger.error(f"Failed to summarize chat {chat_id}: {e}")
+            return
+        if completion.usage is not None:
+            metrics.inc("openai_completions_total", model=self.model)
+            metrics.inc(
+                "openai_prompt_tokens_total",
+                completion.usage.prompt_tokens,
+                model=self.model,
+            )
+            metrics.inc(
+                "openai_completion_tokens_total",
+                completion.usage.completion_tokens,
+                model=self.model,
+            )
+        text = completion.choices[0].message.content
+        if text:
+            self._summaries[chat_id] = Summary(text, _fingerprint(messages[-1]))
+            logger.info(f"Summarized {len(messages)} messages of chat {chat_id}")
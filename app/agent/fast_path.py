@@ -0,0 +1,140 @@
+import re
+from dataclasses import dataclass
+from typing import Literal
+
+from app.storage.expenses.base import ExpenseStorageInterface
+from app.utils.config import settings
+from app.utils.merchant_memory import MerchantMemory
+
+PaymentMethod = Literal["cash", "card", "transfer", "p2p"]
+
+AMOUNT = r"(?P<amount>\d+(?:[.,]\d{1,2})?)\s*(?:€|eur|euros?)?"
+METHOD = (
+    r"(?:,?\s+(?:(?:con|with|en|in|por|by|paid\s+with|pagado\s+con)\s+)?"
+    r"(?P<method>tarjeta(?:\s+de\s+cr[eé]dito)?|(?:credit\s+)?card|efectivo|cash|"
+    r"transferencia|transfer|bizum|p2p))?"
+)
+# "45,60 en Mercadona con tarjeta", "12 at Starbucks, cash"
+AMOUNT_FIRST = re.compile(
+    rf"^{AMOUNT}\s+(?:en|in|at)\s+(?P<merchant>[^\d\s].*?){METHOD}$",
+    re.IGNORECASE,
+)
+# "Mercadona 45,60€ tarjeta"
+MERCHANT_FIRST = re.compile(
+    rf"^(?P<merchant>[^\d\s].*?)\s+{AMOUNT}{METHOD}$", re.IGNORECASE
+)
+
+METHODS: dict[str, PaymentMethod] = {
+    "tarjeta": "card",
+    "card": "card",
+    "efectivo": "cash",
+    "cash": "cash",
+    "transferencia": "transfer",
+    "transfer": "transfer",
+    "bizum": "p2p",
+    "p2p": "p2p",
+}
+SPANISH_WORDS = {"en", "con", "por", "pagado", "tarjeta", "efectivo", "transferencia"}
+
+# The confirmation format of the prompt, for the languages of the grammar
+CONFIRMATIONS = {
+    "english": "Added {method} expense of {cost}{currency} in `{category}` with concept **{concept}**",
+    "spanish": "Añadido gasto {method} de {cost}{currency} en `{category}` con concepto **{concept}**",
+}
+METHOD_NAMES = {
+    "english": {"card": "card", "cash": "cash", "transfer": "transfer", "p2p": "p2p"},
+    "spanish": {
+        "card": "con tarjeta de crédito",
+        "cash": "en efectivo",
+        "transfer": "por transferencia",
+        "p2p": "por p2p",
+    },
+}
+
+
+@dataclass
+class ParsedExpense:
+    cost: float
+    merchant: str
+    payment_method: PaymentMethod
+    language: str
+
+
+def parse_expense_message(text: str) -> ParsedExpense | None:
+    """Parse a message made only of an amount, a merchant and a payment method.
+
+    Returns None for anything else, including messages without a payment
+    method, which the agent has to ask for.
+    """
+    text = " ".join(text.split()).rstrip(".")
+    match = AMOUNT_FIRST.match(text) or MERCHANT_FIRST.match(text)
+    if match is None or match["method"] is None:
+        return None
+    method = next(
+        METHODS[word] for word in match["method"].lower().split() if word in METHODS
+    )
+    words = set(text.lower().split())
+    if words & SPANISH_WORDS:
+        language = "spanish"
+    elif words & {"in", "at", "with", "by", "paid", "card", "cash"}:
+        language = "english"
+    else:
+        language = settings.DEFAULT_LANGUAGE.lower()
+    if language not in CONFIRMATIONS:
+        return None
+    return ParsedExpense(
+        cost=float(match["amount"].replace(",", ".")),
+        merchant=match["merchant"].strip(" ,"),
+        payment_method=method,
+        language=language,
+    )
+
+
+class FastPath:
+    """Adds simple expense messages without going through the model.
+
+    The category comes from the categories used before for the same merchant,
+    kept in a MerchantMemory in sync with the expense storage. Messages that do
+    not parse, or whose merchant has no clear category, are left to the agent.
+    """
+
+    def __init__(self, storage: ExpenseStorageInterface):
+        self.storage = storage
+        self.memory = MerchantMemory()
+        self._version: int | None = None
+
+    async def _sync_memory(self) -> None:
+        version = self.storage.version()
+        if version is None or version != self._version:
+            self.memory.rebuild(await self.storage.get_expenses())
+            self._version = version
+
+    async def resolve(self, text: str) -> tuple[ParsedExpense, list[str], str] | None:
+        """The parsed message with its category and concept, if confident"""
+        parsed = parse_expense_message(text)
+        if parsed is None:
+            return None
+        await self._sync_memory()
+        category = self.memory.category(parsed.merchant)
+        if category is None:
+            return None
+        concept = self.memory.spelling(parsed.merchant) or parsed.merchant
+        return parsed, category, concept[:1].upper() + concept[1:]
+
+    def learn(self, concept: str, category: list[str]) -> None:
+        """Account for an expense added by the fast path, saving a rebuild"""
+        self.memory.learn(concept, category)
+        current = self.storage.version()
+        # Only valid if no other write happened since the last sync
+        if self._version is not None and current == self._version + 1:
+            self._version = current
+
+    @staticmethod
+    def confirmation(parsed: ParsedExpense, category: list[str], concept: str) -> str:
+        return CONFIRMATIONS[parsed.language].format(
+            method=METHOD_NAMES[parsed.language][parsed.payment_method],
+            cost=f"{parsed.cost:.2f}",
+            currency=settings.DEFAULT_CURRENCY,
+            category="/".join(category),
+            concept=concept,
+        )
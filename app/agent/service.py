@@ -1,9 +1,18 @@
+import asyncio
+import os
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Awaitable, Callable
+from uuid import uuid4
 
 import yaml
 from jinja2 import Template
 from openai import AsyncOpenAI, pydantic_function_tool
+from openai.types.chat import (
+    ChatCompletion,
+    ChatCompletionMessageParam,
+    ChatCompletionMessageToolCall,
+)
 from openai.types.chat.chat_completion_assistant_message_param import (
     ChatCompletionAssistantMessageParam,
 )
@@ -17,6 +26,8 @@ from openai.types.chat.chat_completion_user_message_param import (
     ChatCompletionUserMessageParam,
 )
 
+from app.agent.context import ConversationContext
+from app.agent.fast_path import FastPath
 from app.agent.tools.add_expense.tool import AddExpense
 from app.agent.tools.base import BaseTool, ResponseContext, get_tool_instance
 from app.agent.tools.edit_expense.tool import EditExpense
@@ -26,6 +37,7 @@ from app.storage.expenses.base import ExpenseStorageInterface
 from app.utils.categories import get_categories_str
 from app.utils.config import settings
 from app.utils.logger import logger
+from app.utils.metrics import metrics
 
 TOOLS: list[type[BaseTool]] = [AddExpense, EditExpense, QueryExpenses]
 TOOL_MAP = {str(tool_class.__name__): tool_class for tool_class in TOOLS}
@@ -33,9 +45,17 @@ CATEGORIES_PATH = "expense_categories.yml"
 SPECIAL_INSTRUCTIONS_PATH = "category_instructions.txt"
 
 SYSTEM_PROMPT_PATH = Path(__file__).parent / "prompt.jinja2"
-SYSTEM_PROMPT_TEMPLATE = Template(SYSTEM_PROMPT_PATH.read_text())
+CONTEXT_PROMPT_PATH = Path(__file__).parent / "prompt_context.jinja2"
+CONTEXT_PROMPT_TEMPLATE = Template(CONTEXT_PROMPT_PATH.read_text())
+LATEST_EXPENSES = 20
+MODEL = "gpt-4o-mini"
+
 
-SPECIAL_INSTRUCTIONS = Path(SPECIAL_INSTRUCTIONS_PATH).read_text()
+def _mtime(path: str | Path) -> float | None:
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
 
 
 class AgentService:
@@ -49,50 +69,280 @@ class AgentService:
         self.expense_storage = expense_storage
         self.chat_storage = chat_storage
         self.tool_schemas = [pydantic_function_tool(tool_class) for tool_class in TOOLS]
+        self.context = ConversationContext(openai_client)
+        self._system_message: ChatCompletionSystemMessageParam | None = None
+        self._system_key: tuple | None = None
+        self._latest_expenses = ""
+        self._latest_expenses_version: int | None = None
+        self._write_lock = asyncio.Lock()
+        self.fast_path = FastPath(expense_storage)
+
+    def _get_system_message(self) -> ChatCompletionSystemMessageParam:
+        """The static part of the prompt: rules, tools and categories.
+
+        It is the prefix of every request, so it is only rendered again when the
+        files it comes from change, keeping OpenAI's prompt cache warm.
+        """
+        key = tuple(
+            _mtime(path)
+            for path in (SYSTEM_PROMPT_PATH, CATEGORIES_PATH, SPECIAL_INSTRUCTIONS_PATH)
+        )
+        if self._system_message is None or key != self._system_key:
+            categories: dict[str, dict | None] = yaml.safe_load(
+                Path(CATEGORIES_PATH).read_text()
+            )
+            special_instructions_path = Path(SPECIAL_INSTRUCTIONS_PATH)
+            content = Template(SYSTEM_PROMPT_PATH.read_text()).render(
+                language=settings.DEFAULT_LANGUAGE,
+                currency=settings.DEFAULT_CURRENCY,
+                categories=get_categories_str(categories),
+                special_instructions=special_instructions_path.read_text()
+                if special_instructions_path.exists()
+                else "",
+            )
+            self._system_message = ChatCompletionSystemMessageParam(
+                content=content, role="system"
+            )
+            self._system_key = key
+        return self._system_message
+
+    async def _get_context_message(self) -> ChatCompletionSystemMessageParam:
+        """The volatile part of the prompt, sent after the conversation"""
+        version = self.expense_storage.version()
+        if version is None or version != self._latest_expenses_version:
+            expenses = await self.expense_storage.get_latest_expenses(LATEST_EXPENSES)
+            self._latest_expenses = CONTEXT_PROMPT_TEMPLATE.render(
+                currency=settings.DEFAULT_CURRENCY,
+                expenses=expenses,
+            )
+            self._latest_expenses_version = version
+        now = datetime.now(timezone.utc)
+        return ChatCompletionSystemMessageParam(
+            content=f"{self._latest_expenses}\n"
+            f"The current date and time is {now.strftime('%Y-%m-%d %H:%M:%S')}",
+            role="system",
+        )
 
-    async def _get_system_message(
-        self, response_context: ResponseContext
-    ) -> ChatCompletionSystemMessageParam:
-        categories: dict[str, dict | None] = yaml.safe_load(
-            Path(CATEGORIES_PATH).read_text()
+    def _record_usage(self, completion: ChatCompletion) -> None:
+        if completion.usage is None:
+            return
+        details = completion.usage.prompt_tokens_details
+        cached = (details.cached_tokens or 0) if details else 0
+        # Labelled with the requested model, like the request latency, rather
+        # than the snapshot it resolved to
+        model = MODEL
+        metrics.inc("openai_completions_total", model=model)
+        metrics.inc(
+            "openai_prompt_tokens_total", completion.usage.prompt_tokens, model=model
+        )
+        metrics.inc("openai_cached_prompt_tokens_total", cached, model=model)
+        metrics.inc(
+            "openai_completion_tokens_total",
+            completion.usage.completion_tokens,
+            model=model,
         )
-        content = SYSTEM_PROMPT_TEMPLATE.render(
-            language=settings.DEFAULT_LANGUAGE,
-            currency=settings.DEFAULT_CURRENCY,
-            categories=get_categories_str(categories),
-            special_instructions=SPECIAL_INSTRUCTIONS,
-            expenses=(await self.expense_storage.get_expenses())[-20:],
-            now=datetime.now(timezone.utc),
+        logger.info(
+            f"Prompt tokens: {completion.usage.prompt_tokens} ({cached} cached), "
+            f"cache hit rate so far: "
+            f"{metrics.ratio('openai_cached_prompt_tokens_total', 'openai_prompt_tokens_total'):.0%}"
         )
-        return ChatCompletionSystemMessageParam(content=content, role="system")
+
+    async def _call_tool(
+        self,
+        tool_call: ChatCompletionMessageToolCall,
+        response_context: ResponseContext,
+    ) -> ChatCompletionToolMessageParam:
+        logger.info(
+            f"Calling tool with id {tool_call.id}: {tool_call.function.name} with args: {tool_call.function.arguments}"
+        )
+        tool_name = tool_call.function.name
+        try:
+            tool_instance = get_tool_instance(tool_call, TOOL_MAP)
+            tool_name = type(tool_instance).__name__
+            if tool_instance.WRITES:
+                # Writes go one at a time, e.g. an edit reads and then updates
+                async with self._write_lock:
+                    with metrics.timer("tool_seconds", tool=tool_name):
+                        tool_result = await tool_instance.call(response_context)
+            else:
+                with metrics.timer("tool_seconds", tool=tool_name):
+                    tool_result = await tool_instance.call(response_context)
+        except Exception as e:
+            metrics.inc("tool_errors_total", tool=tool_name)
+            logger.error(f"Error calling tool {tool_call.id}: {e}")
+            tool_result = f"Error calling tool {tool_call.id}: {e}"
+        logger.info(f"Tool result for {tool_call.id}: {tool_result}")
+        return ChatCompletionToolMessageParam(
+            content=tool_result, role="tool", tool_call_id=tool_call.id
+        )
+
+    async def _create_completion(
+        self,
+        messages: list[ChatCompletionMessageParam],
+        on_text: Callable[[str], Awaitable[None]] | None,
+    ) -> ChatCompletion:
+        """Create a completion, streaming it when `on_text` is given.
+
+        `on_text` gets the text received so far after every content chunk. The
+        chunks are put back together into a regular ChatCompletion.
+        """
+        if on_text is None:
+            return await self.openai.chat.completions.create(
+                model=MODEL, messages=messages, tools=self.tool_schemas
+            )
+        stream = await self.openai.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            tools=self.tool_schemas,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        content = ""
+        tool_calls: dict[int, dict] = {}
+        finish_reason = "stop"
+        usage = None
+        completion_id, created = "", 0
+        async for chunk in stream:
+            completion_id, created = chunk.id, chunk.created
+            if chunk.usage is not None:
+                usage = chunk.usage.model_dump()
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            for tool_call in choice.delta.tool_calls or []:
+                entry = tool_calls.setdefault(
+                    tool_call.index,
+                    {
+                        "id": "",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    },
+                )
+                entry["id"] = tool_call.id or entry["id"]
+                if tool_call.function is not None:
+                    entry["function"]["name"] += tool_call.function.name or ""
+                    entry["function"]["arguments"] += tool_call.function.arguments or ""
+            if choice.delta.content:
+                content += choice.delta.content
+                await on_text(content)
+        return ChatCompletion.model_validate(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": MODEL,
+                "usage": usage,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": finish_reason,
+                        "message": {
+                            "role": "assistant",
+                            "content": content or None,
+                            "tool_calls": [tool_calls[i] for i in sorted(tool_calls)]
+                            or None,
+                        },
+                    }
+                ],
+            }
+        )
+
+    async def _try_fast_path(
+        self, chat_id: int, user_message: str, user_name: str | None
+    ) -> str | None:
+        """Add a simple expense message without the model, see FastPath.
+
+        The exchange is stored as the model would have made it, with an
+        AddExpense call, so later turns can refer to the expense.
+        """
+        if not settings.FAST_PATH_ENABLED or not user_name:
+            return None
+        resolved = await self.fast_path.resolve(user_message)
+        if resolved is None:
+            metrics.inc("fast_path_misses_total")
+            return None
+        parsed, category, concept = resolved
+        tool = AddExpense(
+            sender=user_name,
+            cost=parsed.cost,
+            concept=concept,
+            category=category,
+            payment_method=parsed.payment_method,
+        )
+        async with self._write_lock:
+            tool_result = await tool.call(ResponseContext(storage=self.expense_storage))
+            self.fast_path.learn(concept, category)
+        reply = self.fast_path.confirmation(parsed, category, concept)
+        tool_call_id = f"call_fast_{uuid4().hex[:16]}"
+        await self.chat_storage.add_message(
+            chat_id,
+            ChatCompletionAssistantMessageParam(
+                role="assistant",
+                tool_calls=[
+                    {
+                        "id": tool_call_id,
+                        "type": "function",
+                        "function": {
+                            "name": "AddExpense",
+                            "arguments": tool.model_dump_json(exclude_none=True),
+                        },
+                    }
+                ],
+            ),
+        )
+        await self.chat_storage.add_message(
+            chat_id,
+            ChatCompletionToolMessageParam(
+                role="tool", content=tool_result, tool_call_id=tool_call_id
+            ),
+        )
+        await self.chat_storage.add_message(
+            chat_id,
+            ChatCompletionAssistantMessageParam(role="assistant", content=reply),
+        )
+        metrics.inc("fast_path_hits_total")
+        logger.info(f"Fast path: {tool_result}")
+        return reply
 
     async def get_text_response(
         self,
         user_message: str,
+        chat_id: int,
         user_name: str | None = None,
-        message_limit: int = 20,
+        on_text: Callable[[str], Awaitable[None]] | None = None,
     ) -> str:
+        """Run the agent on a user message and return its final answer.
+
+        With `on_text` the completions are streamed, see _create_completion.
+        """
         logger.info("Getting text response from agent")
         message = ChatCompletionUserMessageParam(role="user", content=user_message)
         if user_name:
             message["name"] = user_name
 
-        messages = await self.chat_storage.add_message(message)
-        messages = messages[-message_limit:]
+        messages = await self.chat_storage.add_message(chat_id, message)
+        reply = await self._try_fast_path(chat_id, user_message, user_name)
+        if reply is not None:
+            return reply
         response_context = ResponseContext(storage=self.expense_storage)
         while True:
-            system_message = await self._get_system_message(response_context)
-            completion = await self.openai.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[system_message] + messages,
-                tools=self.tool_schemas,
+            # Stable content first and volatile last, so requests share the
+            # longest possible prefix for prompt caching
+            request = (
+                [self._get_system_message()]
+                + self.context.window(chat_id, messages)
+                + [await self._get_context_message()]
             )
-            logger.info(f"Completion: {completion}")
+            with metrics.timer("openai_request_seconds", model=MODEL):
+                completion = await self._create_completion(request, on_text)
+            logger.debug(f"Completion: {completion}")
+            self._record_usage(completion)
             completion_message = completion.choices[0].message
             message_param = ChatCompletionAssistantMessageParam(
                 **completion_message.model_dump(mode="json")
             )
-            messages = await self.chat_storage.add_message(message_param)
+            messages = await self.chat_storage.add_message(chat_id, message_param)
             if not completion_message.tool_calls:
                 logger.info(
                     f"No tool calls, returning content: {completion_message.content}"
@@ -101,19 +351,13 @@ class AgentService:
                     raise ValueError("Tool call without content")
                 return completion_message.content
 
-            tool_call = completion_message.tool_calls[0]
-            logger.info(
-                f"Calling tool with id {tool_call.id}: {tool_call.function.name} with args: {tool_call.function.arguments}"
-            )
-            tool_instance = get_tool_instance(tool_call, TOOL_MAP)
-
-            try:
-                tool_result = await tool_instance.call(response_context)
-            except Exception as e:
-                logger.error(f"Error calling tool {tool_call.id}: {e}")
-                tool_result = f"Error calling tool {tool_call.id}: {e}"
-            logger.info(f"Tool result for {tool_call.id}: {tool_result}")
-            tool_message = ChatCompletionToolMessageParam(
-                content=tool_result, role="tool", tool_call_id=tool_call.id
+            # Independent tool calls run concurrently, and their results are
+            # all sent back in the next completion
+            tool_messages = await asyncio.gather(
+                *(
+                    self._call_tool(tool_call, response_context)
+                    for tool_call in completion_message.tool_calls
+                )
             )
-            messages = await self.chat_storage.add_message(tool_message)
+            for tool_message in tool_messages:
+                messages = await self.chat_storage.add_message(chat_id, tool_message)
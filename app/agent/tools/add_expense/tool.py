@@ -12,6 +12,8 @@ from app.models.expense import Expense
 class AddExpense(BaseTool):
     """Add an expense to the database."""
 
+    WRITES = True
+
     timestamp: str | None = Field(
         default=None,
         description="The timestamp of the expense in ISO format. Defaults to the current timestamp.",
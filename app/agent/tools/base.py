@@ -1,6 +1,6 @@
 import json
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, ClassVar
 
 from openai.types.chat import ChatCompletionMessageToolCall
 from pydantic import BaseModel
@@ -14,6 +14,9 @@ class ResponseContext:
 
 
 class BaseTool(BaseModel):
+    # Tools that modify the storage, which run one at a time
+    WRITES: ClassVar[bool] = False
+
     async def call(self, response_context: ResponseContext) -> str:
         raise NotImplementedError("call method must be implemented by the subclass")
 
@@ -9,6 +9,8 @@ from app.models.expense import Expense
 class EditExpense(BaseTool):
     """Edit an expense in the database by providing the expense ID values to update. Any field with null will be left unchanged."""
 
+    WRITES = True
+
     expense_id: str
     timestamp: str | None = None
     sender: str | None = None
@@ -21,8 +23,7 @@ class EditExpense(BaseTool):
     metadata: dict | None = None
 
     async def call(self, response_context: ResponseContext) -> str:
-        expenses = await response_context.storage.get_expenses()
-        expense = next((e for e in expenses if e.expense_id == self.expense_id), None)
+        expense = await response_context.storage.get_expense(self.expense_id)
         if not expense:
             return f"Expense with id {self.expense_id} not found"
 
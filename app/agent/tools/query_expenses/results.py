@@ -0,0 +1,82 @@
+import base64
+import csv
+import hashlib
+import io
+import json
+from typing import Any
+
+from app.storage.sqlite_mirror import QueryPage
+
+# Longer cell values, e.g. details or metadata, are cut to this length
+MAX_CELL_CHARS = 200
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def _query_key(sql: str) -> str:
+    return hashlib.sha1(" ".join(sql.split()).encode()).hexdigest()[:12]
+
+
+def encode_cursor(sql: str, offset: int) -> str:
+    """Opaque cursor to the rows of `sql` starting at `offset`"""
+    payload = json.dumps({"q": _query_key(sql), "o": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(sql: str, cursor: str) -> int:
+    """Offset of the cursor, which must come from the same query"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        query_key, offset = payload["q"], int(payload["o"])
+    except Exception as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if query_key != _query_key(sql) or offset < 0:
+        raise InvalidCursorError("The cursor belongs to a different query")
+    return offset
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return format(value, ".10g")
+    if isinstance(value, str) and len(value) > MAX_CELL_CHARS:
+        return value[: MAX_CELL_CHARS - 1] + "…"
+    return value
+
+
+def format_page(sql: str, page: QueryPage, max_chars: int) -> str:
+    """Page as CSV, with as many rows as fit in `max_chars`, and a note on the
+    rows left out with the cursor to the next ones"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(page.frame.columns)
+    shown = 0
+    for row in page.frame.itertuples(index=False):
+        end = buffer.tell()
+        writer.writerow([_cell(value) for value in row])
+        # Always show at least one row, even a long one
+        if shown and buffer.tell() > max_chars:
+            buffer.seek(end)
+            buffer.truncate()
+            break
+        shown += 1
+    text = buffer.getvalue()
+    if not shown:
+        return "No results found" if page.offset == 0 else "No more results"
+
+    first, last = page.offset + 1, page.offset + shown
+    if page.total is not None and last >= page.total:
+        if page.offset == 0:
+            return text
+        return f"{text}(rows {first}-{last} of {page.total})"
+    of_total = f"of {page.total}" if page.total is not None else "of more"
+    cursor = encode_cursor(sql, last)
+    return (
+        f"{text}(rows {first}-{last} {of_total}, the rest were left out. Aggregate "
+        f'in SQL, or call again with the same sql and cursor "{cursor}" for the next '
+        "rows)"
+    )
@@ -1,9 +1,12 @@
-import json
-
-import pandas as pd
-from pandasql import sqldf
+from pydantic import Field
 
 from app.agent.tools.base import BaseTool, ResponseContext
+from app.agent.tools.query_expenses.results import (
+    InvalidCursorError,
+    decode_cursor,
+    format_page,
+)
+from app.utils.config import settings
 from app.utils.logger import logger
 
 
@@ -25,30 +28,33 @@ class QueryExpenses(BaseTool):
         tags TEXT,      -- a string like "tag1,tag2,tag3", not an array
         metadata TEXT   -- a JSON string
     );
+
+    Results are returned as CSV, a page at a time. Long results end with a
+    cursor to get the next page.
     """
 
     sql: str
+    cursor: str | None = Field(
+        default=None,
+        description="Cursor from a previous result of the same sql, to get its next page.",
+    )
 
     async def call(self, response_context: ResponseContext) -> str:
-        expenses = await response_context.storage.get_expenses()
-        df = pd.DataFrame(
-            [
-                {
-                    **expense.model_dump(mode="json"),
-                    "category": "/".join(expense.category),
-                    "tags": ",".join(expense.tags) if expense.tags else None,
-                    "metadata": json.dumps(expense.metadata)
-                    if expense.metadata
-                    else None,
-                }
-                for expense in expenses
-            ]
-        )
         try:
-            result = sqldf(self.sql, {"expenses": df})
+            offset = decode_cursor(self.sql, self.cursor) if self.cursor else 0
+        except InvalidCursorError as e:
+            return f"{e}, run the query again without it"
+        try:
+            page = await response_context.storage.query_expenses_page(
+                self.sql,
+                offset=offset,
+                limit=settings.QUERY_MAX_ROWS,
+                timeout=settings.QUERY_TIMEOUT,
+            )
+        except TimeoutError as e:
+            logger.warning(f"Query timed out: {self.sql}")
+            return f"{e}, simplify the query or make it more selective"
         except Exception as e:
             logger.exception(f"Error executing query: {e}")
             return f"Error executing query: {e}"
-        if result is None or result.empty:
-            return "No results found"
-        return result.to_string()
+        return format_page(self.sql, page, settings.QUERY_MAX_CHARS)
@@ -1,4 +1,7 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils.metrics import metrics
 
 router = APIRouter()
 
@@ -7,3 +10,11 @@ router = APIRouter()
 async def health_check():
     """Basic health check endpoint"""
     return {"status": "ok"}
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Counters, gauges and histograms in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
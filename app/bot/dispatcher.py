@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any
+
+from telegram import Update
+from telegram.ext import Application
+
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+
+class UpdateDispatcher:
+    """Processes the updates of the application's update queue concurrently.
+
+    Updates of the same chat are processed one at a time and in order, each
+    chat has its own queue drained by a single task. Updates of different
+    chats run in parallel, at most `workers` at once. Once `max_pending`
+    updates are waiting, no more are taken from the update queue until some
+    are done, so a burst backs up in the update queue instead of in memory.
+
+    Queue depths and the time updates wait before being processed are
+    recorded in the metrics.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        workers: int = settings.UPDATE_WORKERS,
+        max_pending: int = settings.UPDATE_MAX_PENDING,
+    ):
+        self.application = application
+        self._workers = asyncio.Semaphore(workers)
+        self._slots = asyncio.Semaphore(max_pending)
+        self._chats: dict[Any, deque[tuple[object, float]]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._pending = 0
+        self._reader: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._reader = asyncio.create_task(self._read())
+
+    @staticmethod
+    def _chat_key(update: object) -> Any:
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        # Updates without a chat have no ordering to keep
+        return ("update", id(update))
+
+    def _record_depth(self) -> None:
+        metrics.set("updates_pending", self._pending)
+        metrics.set("updates_queued", self.application.update_queue.qsize())
+        metrics.set("updates_active_chats", len(self._chats))
+
+    async def _read(self) -> None:
+        queue = self.application.update_queue
+        while True:
+            await self._slots.acquire()
+            update = await queue.get()
+            self._dispatch(update)
+            queue.task_done()
+
+    def _dispatch(self, update: object) -> None:
+        key = self._chat_key(update)
+        self._pending += 1
+        if key in self._chats:
+            self._chats[key].append((update, time.monotonic()))
+        else:
+            self._chats[key] = deque([(update, time.monotonic())])
+            task = asyncio.create_task(self._drain_chat(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._record_depth()
+
+    async def _drain_chat(self, key: Any) -> None:
+        chat_queue = self._chats[key]
+        while chat_queue:
+            update, queued_at = chat_queue[0]
+            async with self._workers:
+                metrics.observe("update_wait_seconds", time.monotonic() - queued_at)
+                started = time.monotonic()
+                try:
+                    await self.application.process_update(update)
+                except Exception as e:
+                    logger.error(f"Error processing update: {e}")
+                metrics.observe("update_processing_seconds", time.monotonic() - started)
+            chat_queue.popleft()
+            self._pending -= 1
+            self._slots.release()
+            self._record_depth()
+        del self._chats[key]
+        self._record_depth()
+
+    async def drain(self, timeout: float = settings.UPDATE_DRAIN_TIMEOUT) -> None:
+        """Stop taking updates and wait for the ones already received.
+
+        Call it once the updater is stopped, so no more updates arrive. Updates
+        left in the update queue are processed too. Whatever is still running
+        after `timeout` seconds is cancelled.
+        """
+        if self._reader is not None:
+            self._reader.cancel()
+        queue = self.application.update_queue
+        while not queue.empty():
+            self._dispatch(queue.get_nowait())
+            queue.task_done()
+        if not self._tasks:
+            return
+        logger.info(f"Draining {self._pending} updates")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(
+                f"Cancelled {self._pending} updates not processed after {timeout}s"
+            )
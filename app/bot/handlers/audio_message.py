@@ -1,3 +1,4 @@
+import time
 from io import BytesIO
 
 from openai import AsyncOpenAI
@@ -5,7 +6,8 @@ from telegram import Update
 from telegram.ext import ContextTypes
 
 from app.agent.service import AgentService
-from app.bot.utils import escape_telegram_markdown, filter_message, send_typing_action
+from app.bot.streaming import stream_reply
+from app.bot.utils import filter_message, send_typing_action
 from app.utils.logger import logger
 
 
@@ -16,6 +18,7 @@ async def handle_audio_message(
 ) -> None:
     # Check for either audio or voice message
     assert update.message and (update.message.audio or update.message.voice)
+    started = time.monotonic()
 
     from_user = update.message.from_user
     username = from_user.username if from_user else "unknown"
@@ -45,8 +48,12 @@ async def handle_audio_message(
     logger.info(f"Transcribed audio from {username}: {transcription}")
 
     agent_service: AgentService = context.bot_data["agent_service"]
-    response = await agent_service.get_text_response(transcription, username)
-    logger.info(f"Sending response to {username}: {response}")
-    await update.message.reply_text(
-        escape_telegram_markdown(response), parse_mode="MarkdownV2"
+    chat_id = update.message.chat_id
+    response = await stream_reply(
+        update.message,
+        started,
+        lambda on_text: agent_service.get_text_response(
+            transcription, chat_id, username, on_text=on_text
+        ),
     )
+    logger.info(f"Sent response to {username}: {response}")
@@ -20,7 +20,7 @@ async def handle_command_message(
     command = update.message.text.split(" ")[0]
     if command == "/resetchat":
         chat_history: ChatStorageInterface = context.bot_data["chat_storage"]
-        await chat_history.clear()
+        await chat_history.clear(update.message.chat_id)
         context.bot_data["chat_history"] = chat_history
         await context.bot.send_message(
             chat_id=update.message.chat_id, text="Chat reset"
@@ -28,8 +28,8 @@ async def handle_command_message(
     elif command == "/reloadcache":
         expenses_storage: ExpenseStorageInterface = context.bot_data["expense_storage"]
         incomes_storage: IncomeStorageInterface = context.bot_data["income_storage"]
-        expenses_storage.reload_cache()
-        incomes_storage.reload_cache()
+        await expenses_storage.reload_cache()
+        await incomes_storage.reload_cache()
         await context.bot.send_message(
             chat_id=update.message.chat_id, text="Reloading cache"
         )
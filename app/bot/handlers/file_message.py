@@ -15,7 +15,9 @@ from app.models.movement import Movement
 from app.storage.expenses.base import ExpenseStorageInterface
 from app.storage.incomes.base import IncomeStorageInterface
 from app.utils.logger import logger
+from app.utils.movement_classifier.cache import ClassificationCache
 from app.utils.movement_classifier.main import process_movements
+from app.utils.movement_classifier.similarity import PublishedClassifier
 
 
 def value_to_date(value: Any) -> datetime:
@@ -169,6 +171,8 @@ async def handle_file_message(
     expense_storage: ExpenseStorageInterface = context.bot_data["expense_storage"]
     income_storage: IncomeStorageInterface = context.bot_data["income_storage"]
     openai_client: AsyncOpenAI = context.bot_data["openai"]
+    classification_cache: ClassificationCache = context.bot_data["classification_cache"]
+    movement_classifier: PublishedClassifier = context.bot_data["movement_classifier"]
 
     file = update.message.document
     from_user = update.message.from_user
@@ -200,7 +204,13 @@ async def handle_file_message(
         movements = process_tabular_file(file_bytes, file_extension, file_name)
         movements = sorted(movements, key=lambda x: x.min_date, reverse=False)
         new_expenses_or_incomes = await process_movements(
-            movements, username, expense_storage, income_storage, openai_client
+            movements,
+            username,
+            expense_storage,
+            income_storage,
+            openai_client,
+            classification_cache,
+            await movement_classifier.get(),
         )
     except Exception as e:
         logger.exception(f"Error processing file: {str(e)}")
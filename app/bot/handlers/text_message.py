@@ -1,8 +1,11 @@
+import time
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from app.agent.service import AgentService
-from app.bot.utils import escape_telegram_markdown, filter_message, send_typing_action
+from app.bot.streaming import stream_reply
+from app.bot.utils import filter_message, send_typing_action
 from app.utils.logger import logger
 
 
@@ -12,6 +15,7 @@ async def handle_text_message(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
     assert update.message and update.message.text
+    started = time.monotonic()
 
     from_user = update.message.from_user
     username = from_user.username if from_user else "unknown"
@@ -19,8 +23,12 @@ async def handle_text_message(
     agent_service: AgentService = context.bot_data["agent_service"]
     user_mapping: dict[str, str] = context.bot_data["user_mapping"]
     username = user_mapping.get(username or "", username)
-    response = await agent_service.get_text_response(update.message.text, username)
-    logger.info(f"Sending response to {username}: {response}")
-    await update.message.reply_text(
-        escape_telegram_markdown(response), parse_mode="MarkdownV2"
+    text, chat_id = update.message.text, update.message.chat_id
+    response = await stream_reply(
+        update.message,
+        started,
+        lambda on_text: agent_service.get_text_response(
+            text, chat_id, username, on_text=on_text
+        ),
     )
+    logger.info(f"Sent response to {username}: {response}")
@@ -0,0 +1,172 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+from app.bot.utils import (
+    escape_partial_markdown,
+    escape_telegram_markdown,
+    split_message,
+)
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+PLACEHOLDER = "…"
+ERROR_REPLY = "Something went wrong, please try again"
+# Telegram rejects longer messages, once escaped. Partial text is cut to it and
+# final answers are split into follow-up messages.
+MAX_MESSAGE_LENGTH = 4096
+
+
+class StreamingReply:
+    """Reply that shows an answer while it is being generated.
+
+    A placeholder is sent right away and edited with the text received so far,
+    at most once every `edit_interval` seconds. An answer too long for one
+    message continues in follow-up messages once it is complete. Edits run in the background, so
+    a slow edit never holds back the stream, and only the latest text is sent.
+    The time from `started` (when the message arrived) to the first edit with
+    text is recorded as the `reply_time_to_first_token_seconds` metric.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        started: float,
+        edit_interval: float = settings.TELEGRAM_EDIT_INTERVAL,
+    ):
+        self.message = message
+        self.started = started
+        self.edit_interval = edit_interval
+        self._reply: Message | None = None
+        self._text = ""
+        self._shown = ""
+        self._next_edit = 0.0
+        self._editor: asyncio.Task | None = None
+        self._editing = False
+        self._finished = False
+
+    async def start(self) -> None:
+        self._reply = await self.message.reply_text(PLACEHOLDER)
+
+    async def on_text(self, text: str) -> None:
+        self._text = text
+        if self._editor is None or self._editor.done():
+            self._editor = asyncio.create_task(self._edit_loop())
+
+    async def _rate_limited(self, request: Awaitable[Any]) -> bool:
+        """Await a request to Telegram, False if rate limited until `_next_edit`"""
+        try:
+            await request
+        except RetryAfter as e:
+            logger.warning(f"Replies rate limited for {e.retry_after} seconds")
+            self._next_edit = time.monotonic() + float(e.retry_after)  # type: ignore
+            return False
+        return True
+
+    async def _edit(self, text: str, parse_mode: str | None = "MarkdownV2") -> bool:
+        """Edit the reply, False if rate limited until `_next_edit`"""
+        assert self._reply is not None
+        self._editing = True
+        try:
+            return await self._rate_limited(
+                self._reply.edit_text(text, parse_mode=parse_mode)
+            )
+        except BadRequest as e:
+            # Also raised when the text did not change, which is harmless
+            if "not modified" not in str(e):
+                raise
+        finally:
+            self._editing = False
+        return True
+
+    async def _follow_up(self, text: str, parse_mode: str | None) -> bool:
+        """Send the next part of a long answer, False if rate limited"""
+        return await self._rate_limited(
+            self.message.reply_text(text, parse_mode=parse_mode)
+        )
+
+    async def _edit_loop(self) -> None:
+        while not self._finished and self._text != self._shown:
+            await asyncio.sleep(max(self._next_edit - time.monotonic(), 0))
+            text = self._text
+            self._next_edit = time.monotonic() + self.edit_interval
+            try:
+                shown = split_message(
+                    text, MAX_MESSAGE_LENGTH, escape_partial_markdown
+                )[0]
+                edited = await self._edit(escape_partial_markdown(shown))
+            except Exception as e:
+                logger.error(f"Failed to show partial reply: {e}")
+                return
+            if not edited:
+                continue
+            if not self._shown:
+                metrics.observe(
+                    "reply_time_to_first_token_seconds",
+                    time.monotonic() - self.started,
+                )
+            self._shown = text
+
+    async def finish(self, text: str) -> None:
+        """Replace the partial text with the final answer"""
+        self._finished = True
+        if self._editor is not None and not self._editor.done():
+            if self._editing:
+                # Let the edit in flight land first, so it does not overwrite
+                # the final answer
+                await self._editor
+            else:
+                self._editor.cancel()
+        if not self._shown:
+            # Nothing shown yet, e.g. the whole answer came in the first interval
+            metrics.observe(
+                "reply_time_to_first_token_seconds", time.monotonic() - self.started
+            )
+        self._shown = text
+        first, *rest = split_message(text, MAX_MESSAGE_LENGTH)
+        await self._deliver(first, self._edit)
+        for part in rest:
+            await self._deliver(part, self._follow_up)
+
+    async def _deliver(
+        self, text: str, send: Callable[[str, str | None], Awaitable[bool]]
+    ) -> None:
+        """Send a part of the final answer, as plain text if Telegram rejects
+        its markdown"""
+        parse_mode: str | None = "MarkdownV2"
+        content = escape_telegram_markdown(text)
+        while True:
+            try:
+                if await send(content, parse_mode):
+                    return
+            except BadRequest as e:
+                if parse_mode is None:
+                    raise
+                logger.warning(f"Sending the reply as plain text: {e}")
+                parse_mode, content = None, text
+                continue
+            # The final answer must get through, wait out the rate limit
+            await asyncio.sleep(max(self._next_edit - time.monotonic(), 0))
+
+
+async def stream_reply(
+    message: Message,
+    started: float,
+    respond: Callable[[Callable[[str], Awaitable[None]]], Awaitable[str]],
+) -> str:
+    """Reply to `message` with the answer of `respond`, streamed through the
+    text callback it is given. Returns the final answer."""
+    reply = StreamingReply(message, started)
+    await reply.start()
+    try:
+        response = await respond(reply.on_text)
+    except Exception:
+        # Do not leave the placeholder behind
+        await reply.finish(ERROR_REPLY)
+        raise
+    await reply.finish(response)
+    return response
@@ -1,4 +1,5 @@
 from functools import wraps
+from typing import Callable
 
 from telegram import Update
 from telegram.constants import ChatAction
@@ -95,3 +96,51 @@ def escape_telegram_markdown(text: str) -> str:
         text = text.replace(placeholder, markdown)
 
     return text
+
+
+def escape_partial_markdown(text: str) -> str:
+    """Escape text that is still being generated, for progressive edits.
+
+    A partial answer can have an entity opened but not yet closed, e.g. the
+    start of a bold concept, which Telegram rejects. In that case everything
+    is escaped and shown as plain text until the entity is complete.
+    """
+    escaped = escape_telegram_markdown(text)
+    unescaped = escaped.replace("\\\\", "")
+    for marker in ("*", "_", "`", "~"):
+        if (unescaped.count(marker) - unescaped.count(f"\\{marker}")) % 2:
+            return "".join(
+                f"\\{c}" if c in SPECIAL_CHARS or c == "\\" else c for c in text
+            )
+    return escaped
+
+
+def split_message(
+    text: str, limit: int, escape: Callable[[str], str] = escape_telegram_markdown
+) -> list[str]:
+    """Split text into parts that fit in a message once escaped.
+
+    Parts are cut at the last line break, or else the last space, that keeps
+    the escaped part within `limit` characters. Escaping only lengthens text,
+    so the parts also fit when sent unescaped.
+    """
+    parts: list[str] = []
+    while len(escape(text)) > limit:
+        # Longest prefix whose escaped form fits
+        low, high = 1, min(len(text), limit)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if len(escape(text[:middle])) <= limit:
+                low = middle
+            else:
+                high = middle - 1
+        cut = low
+        for separator in ("\n", " "):
+            position = text.rfind(separator, 0, low)
+            if position > low // 2:
+                cut = position + 1
+                break
+        parts.append(text[:cut])
+        text = text[cut:]
+    parts.append(text)
+    return parts
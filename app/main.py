@@ -13,12 +13,18 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from telegram.ext import Application
 
 from app.agent.service import AgentService
+from app.api.main import router
 from app.bot import setup_handlers
-from app.storage.chat.json_chat import JsonChatStorage
-from app.storage.expenses.google_sheets import GSpreadExpenseStorage
-from app.storage.incomes.google_sheets import GSpreadIncomeStorage
+from app.bot.dispatcher import UpdateDispatcher
+from app.storage.factory import (
+    create_chat_storage,
+    create_expense_storage,
+    create_income_storage,
+)
 from app.utils.config import settings
 from app.utils.logger import logger
+from app.utils.movement_classifier.cache import ClassificationCache
+from app.utils.movement_classifier.similarity import PublishedClassifier
 
 if settings.DEBUG:
     logger.info("Running in debug mode")
@@ -26,9 +32,9 @@ if settings.DEBUG:
 
 # Global instances
 openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-expense_storage = GSpreadExpenseStorage()
-income_storage = GSpreadIncomeStorage()
-chat_storage = JsonChatStorage()
+expense_storage = create_expense_storage()
+income_storage = create_income_storage()
+chat_storage = create_chat_storage()
 agent_service = AgentService(openai_client, expense_storage, chat_storage)
 telegram_app = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).build()
 if Path(settings.USER_MAPPING_FILE).exists():
@@ -51,6 +57,9 @@ telegram_app.bot_data["expense_storage"] = expense_storage
 telegram_app.bot_data["income_storage"] = income_storage
 telegram_app.bot_data["chat_storage"] = chat_storage
 telegram_app.bot_data["agent_service"] = agent_service
+telegram_app.bot_data["classification_cache"] = ClassificationCache(
+    expense_storage, income_storage
+)
 telegram_app.bot_data["user_mapping"] = user_mapping
 
 
@@ -68,18 +77,6 @@ class StateMiddleware(BaseHTTPMiddleware):
         return response
 
 
-async def process_updates():
-    """Process updates from the update queue"""
-    async with telegram_app:
-        while True:
-            try:
-                update = await telegram_app.update_queue.get()
-                await telegram_app.process_update(update)
-                telegram_app.update_queue.task_done()
-            except Exception as e:
-                logger.error(f"Error processing update: {e}")
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator:
     # Startup
@@ -90,6 +87,12 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
     app.state.redis = redis_pool
     # Add Redis pool to bot_data
     telegram_app.bot_data["redis"] = redis_pool
+    # The movement classifier is trained by the worker and shared through Redis
+    telegram_app.bot_data["movement_classifier"] = PublishedClassifier(redis_pool)
+
+    # Start flushing the journaled storage writes
+    await expense_storage.start()
+    await income_storage.start()
 
     # Initialize telegram bot without running polling yet
     await telegram_app.initialize()
@@ -100,35 +103,39 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
     # Start the polling in a background task
     polling_task = asyncio.create_task(telegram_app.updater.start_polling())
 
-    # Start update processing in a background task
-    process_task = asyncio.create_task(process_updates())
+    # Process updates concurrently across chats, in order within each chat
+    dispatcher = UpdateDispatcher(telegram_app)
+    dispatcher.start()
 
     try:
         yield
     finally:
         # Shutdown
         logger.info("Shutting down services...")
-        await redis_pool.close()
 
         # Stop the polling task
         await telegram_app.updater.stop()
         await polling_task
-        process_task.cancel()
 
-        try:
-            await process_task
-        except asyncio.CancelledError:
-            logger.info("Update processing task was cancelled")
+        # Finish the updates already received before closing what they use
+        await dispatcher.drain()
+        await redis_pool.close()
+
+        # Flush pending storage writes
+        await expense_storage.close()
+        await income_storage.close()
+        await chat_storage.close()
 
         # Cleanup telegram bot
         if telegram_app.running:
             await telegram_app.stop()
-            await telegram_app.shutdown()
+        await telegram_app.shutdown()
 
 
 # Create FastAPI app with lifespan
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(StateMiddleware)
+app.include_router(router)
 
 setup_handlers(telegram_app)
 
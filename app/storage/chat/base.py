@@ -4,16 +4,22 @@ from openai.types.chat import ChatCompletionMessageParam
 
 
 class ChatStorageInterface(ABC):
+    """Chat histories, one per Telegram chat id"""
+
     @abstractmethod
     async def add_message(
-        self, message: ChatCompletionMessageParam
+        self, chat_id: int, message: ChatCompletionMessageParam
     ) -> list[ChatCompletionMessageParam]:
         pass
 
     @abstractmethod
-    async def get_messages(self) -> list[ChatCompletionMessageParam]:
+    async def get_messages(self, chat_id: int) -> list[ChatCompletionMessageParam]:
         pass
 
     @abstractmethod
-    async def clear(self) -> None:
+    async def clear(self, chat_id: int) -> None:
+        pass
+
+    async def close(self) -> None:
+        """Persist anything buffered, called on shutdown"""
         pass
@@ -11,27 +11,28 @@ from app.storage.chat.base import ChatStorageInterface
 class JsonChatStorage(ChatStorageInterface):
     def __init__(self, file_path: str = "chat_history.json"):
         self.file_path = Path(file_path)
-        self._ensure_file_exists()
 
-    def _ensure_file_exists(self) -> None:
-        if not self.file_path.exists():
-            self.file_path.write_text("[]")
+    def _path(self, chat_id: int) -> Path:
+        path = self.file_path.with_stem(f"{self.file_path.stem}_{chat_id}")
+        if not path.exists():
+            path.write_text("[]")
+        return path
 
     async def add_message(
-        self, message: ChatCompletionMessageParam
+        self, chat_id: int, message: ChatCompletionMessageParam
     ) -> list[ChatCompletionMessageParam]:
-        messages = await self.get_messages()
+        messages = await self.get_messages(chat_id)
         messages.append(message)
         content_str = json.dumps(messages, indent=2, ensure_ascii=False)
         await asyncio.to_thread(
-            self.file_path.write_text, content_str, encoding="utf-8"
+            self._path(chat_id).write_text, content_str, encoding="utf-8"
         )
         return messages
 
-    async def get_messages(self) -> List[ChatCompletionMessageParam]:
-        content = await asyncio.to_thread(self.file_path.read_text)
+    async def get_messages(self, chat_id: int) -> List[ChatCompletionMessageParam]:
+        content = await asyncio.to_thread(self._path(chat_id).read_text)
         messages_data = json.loads(content)
         return messages_data
 
-    async def clear(self) -> None:
-        self.file_path.write_text("[]")
+    async def clear(self, chat_id: int) -> None:
+        self._path(chat_id).write_text("[]")
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from openai.types.chat import ChatCompletionMessageParam
+
+from app.storage.chat.base import ChatStorageInterface
+from app.utils.config import settings
+from app.utils.logger import logger
+
+
+class ChatLog:
+    """History of one chat, kept as an append-only JSON lines log.
+
+    Adding a message writes a single line, and the writes are fsynced in batches
+    every `fsync_interval` seconds by a background task. The last
+    `memory_messages` messages are kept in memory and served by `get_messages`,
+    so the log is only read on startup. Once the log holds more than
+    `max_log_messages` lines it is rotated in the background: the current log
+    is kept as `<name>.1` and a new one is started with the in-memory messages.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        memory_messages: int,
+        max_log_messages: int,
+        fsync_interval: float,
+        legacy_path: Path | None = None,
+    ):
+        self.file_path = file_path
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_log_messages = max(max_log_messages, memory_messages)
+        self.fsync_interval = fsync_interval
+        self._messages: deque[ChatCompletionMessageParam] = deque(
+            maxlen=memory_messages
+        )
+        if not self.file_path.exists() and legacy_path and legacy_path.exists():
+            self._import_legacy(legacy_path)
+        self._log_messages = self._load()
+        # Binary mode, as buffered binary files are safe to flush from the
+        # fsync thread while the event loop writes
+        self._file = self.file_path.open("ab")
+        self._dirty = asyncio.Event()
+        self._file_lock = asyncio.Lock()
+        self._syncer: asyncio.Task | None = None
+        self._compactor: asyncio.Task | None = None
+
+    def _import_legacy(self, legacy_path: Path) -> None:
+        """Start the log from the history of the old JSON array storage"""
+        messages = json.loads(legacy_path.read_text(encoding="utf-8"))
+        self._write_log(self.file_path, messages)
+        logger.info(f"Imported {len(messages)} messages from {legacy_path}")
+
+    def _load(self) -> int:
+        count = 0
+        with self.file_path.open("a+", encoding="utf-8") as f:
+            f.seek(0)
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    self._messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn write from a crash, before the batch was fsynced
+                    logger.warning(f"Skipping corrupt line in {self.file_path}")
+                    continue
+                count += 1
+        return count
+
+    @staticmethod
+    def _encode(messages: list[ChatCompletionMessageParam]) -> bytes:
+        return "".join(
+            json.dumps(message, ensure_ascii=False) + "\n" for message in messages
+        ).encode("utf-8")
+
+    def _write_log(
+        self, path: Path, messages: list[ChatCompletionMessageParam]
+    ) -> None:
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(self._encode(messages))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _fsync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await self._dirty.wait()
+            # Let the writes of a whole turn pile up before paying for the fsync
+            await asyncio.sleep(self.fsync_interval)
+            self._dirty.clear()
+            async with self._file_lock:
+                try:
+                    await asyncio.to_thread(self._fsync)
+                except Exception as e:
+                    logger.error(f"Failed to fsync {self.file_path}: {e}")
+
+    async def _rotate(self) -> None:
+        async with self._file_lock:
+            snapshot = list(self._messages)
+            total = self._log_messages
+            rotated_path = self.file_path.with_suffix(self.file_path.suffix + ".1")
+            new_path = self.file_path.with_suffix(self.file_path.suffix + ".new")
+            await asyncio.to_thread(self._write_log, new_path, snapshot)
+            # From here on nothing awaits, so no message is added until the new
+            # log is in place. Messages added while the snapshot was written are
+            # the last ones in memory
+            added = min(self._log_messages - total, len(self._messages))
+            self._file.close()
+            os.replace(self.file_path, rotated_path)
+            os.replace(new_path, self.file_path)
+            self._file = self.file_path.open("ab")
+            if added:
+                self._file.write(self._encode(list(self._messages)[-added:]))
+                self._dirty.set()
+            self._log_messages = len(snapshot) + added
+        logger.info(
+            f"Rotated chat log {self.file_path} keeping {self._log_messages} messages"
+        )
+
+    def _ensure_syncer(self) -> None:
+        if self._syncer is None or self._syncer.done():
+            self._syncer = asyncio.create_task(self._sync_loop())
+
+    async def add_message(
+        self, message: ChatCompletionMessageParam
+    ) -> list[ChatCompletionMessageParam]:
+        self._messages.append(message)
+        self._file.write(self._encode([message]))
+        self._log_messages += 1
+        self._ensure_syncer()
+        self._dirty.set()
+        if self._log_messages > self.max_log_messages and (
+            self._compactor is None or self._compactor.done()
+        ):
+            self._compactor = asyncio.create_task(self._rotate())
+        return list(self._messages)
+
+    async def get_messages(self) -> list[ChatCompletionMessageParam]:
+        return list(self._messages)
+
+    async def clear(self) -> None:
+        self._messages.clear()
+        if self._compactor is not None and not self._compactor.done():
+            await self._compactor
+        # The cleared history is kept in the rotated log
+        await self._rotate()
+
+    async def close(self) -> None:
+        if self._compactor is not None and not self._compactor.done():
+            await self._compactor
+        if self._syncer is not None:
+            self._syncer.cancel()
+        async with self._file_lock:
+            await asyncio.to_thread(self._fsync)
+            self._file.close()
+
+
+class JsonlChatStorage(ChatStorageInterface):
+    """One ChatLog per chat, stored as `<chat_id>.jsonl` in `directory`.
+
+    Only the `open_chats` most recently used logs are kept open, the least
+    recently used one is closed when another chat needs its log.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.CHAT_HISTORY_DIR,
+        memory_messages: int = settings.CHAT_MEMORY_MESSAGES,
+        max_log_messages: int = settings.CHAT_LOG_MAX_MESSAGES,
+        fsync_interval: float = settings.CHAT_FSYNC_INTERVAL,
+        open_chats: int = settings.CHAT_CACHE_SIZE,
+        legacy_path: str | None = "chat_history.json",
+    ):
+        self.directory = Path(directory)
+        self.memory_messages = memory_messages
+        self.max_log_messages = max_log_messages
+        self.fsync_interval = fsync_interval
+        self.open_chats = open_chats
+        # The single history of the bot before it was split by chat
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self._logs: OrderedDict[int, ChatLog] = OrderedDict()
+
+    async def _log(self, chat_id: int) -> ChatLog:
+        log = self._logs.get(chat_id)
+        if log is not None:
+            self._logs.move_to_end(chat_id)
+            return log
+        log = ChatLog(
+            self.directory / f"{chat_id}.jsonl",
+            self.memory_messages,
+            self.max_log_messages,
+            self.fsync_interval,
+            self.legacy_path if chat_id == settings.TELEGRAM_CHAT_ID else None,
+        )
+        self._logs[chat_id] = log
+        while len(self._logs) > self.open_chats:
+            _, evicted = self._logs.popitem(last=False)
+            await evicted.close()
+        return log
+
+    async def add_message(
+        self, chat_id: int, message: ChatCompletionMessageParam
+    ) -> list[ChatCompletionMessageParam]:
+        return await (await self._log(chat_id)).add_message(message)
+
+    async def get_messages(self, chat_id: int) -> list[ChatCompletionMessageParam]:
+        return await (await self._log(chat_id)).get_messages()
+
+    async def clear(self, chat_id: int) -> None:
+        await (await self._log(chat_id)).clear()
+
+    async def close(self) -> None:
+        for log in self._logs.values():
+            await log.close()
+        self._logs.clear()
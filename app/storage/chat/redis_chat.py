@@ -0,0 +1,96 @@
+import json
+from collections import OrderedDict
+
+from openai.types.chat import ChatCompletionMessageParam
+from redis.asyncio import Redis
+
+from app.storage.chat.base import ChatStorageInterface
+from app.utils.config import settings
+
+
+class RedisChatStorage(ChatStorageInterface):
+    """Chat histories kept as Redis lists, shared by every API process.
+
+    Each chat has a list of JSON messages, trimmed to the last `max_messages`,
+    and a sequence number incremented on every change. The histories of the
+    `cache_size` most recently used chats are also kept in memory together with
+    their sequence number. A read only costs a GET of the sequence number while
+    no other process has written to the chat, and a write keeps the cached
+    history when the sequence number it gets back follows the cached one.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        max_messages: int = settings.CHAT_MEMORY_MESSAGES,
+        cache_size: int = settings.CHAT_CACHE_SIZE,
+    ):
+        self.redis = redis or Redis(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+        )
+        self.max_messages = max_messages
+        self.cache_size = cache_size
+        self._cache: OrderedDict[int, tuple[int, list[ChatCompletionMessageParam]]] = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def _keys(chat_id: int) -> tuple[str, str]:
+        return f"chat:{chat_id}:messages", f"chat:{chat_id}:seq"
+
+    def _remember(
+        self, chat_id: int, seq: int, messages: list[ChatCompletionMessageParam]
+    ) -> None:
+        self._cache[chat_id] = (seq, messages)
+        self._cache.move_to_end(chat_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, chat_id: int) -> list[ChatCompletionMessageParam]:
+        messages_key, seq_key = self._keys(chat_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(seq_key)
+            pipe.lrange(messages_key, 0, -1)
+            seq, raw_messages = await pipe.execute()
+        messages = [json.loads(raw) for raw in raw_messages]
+        self._remember(chat_id, int(seq or 0), messages)
+        return messages
+
+    async def add_message(
+        self, chat_id: int, message: ChatCompletionMessageParam
+    ) -> list[ChatCompletionMessageParam]:
+        messages_key, seq_key = self._keys(chat_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(messages_key, json.dumps(message, ensure_ascii=False))
+            pipe.ltrim(messages_key, -self.max_messages, -1)
+            pipe.incr(seq_key)
+            _, _, seq = await pipe.execute()
+        cached = self._cache.get(chat_id)
+        if cached is None or cached[0] != seq - 1:
+            # Not cached, or another process wrote to the chat in between
+            return list(await self._load(chat_id))
+        messages = cached[1]
+        messages.append(message)
+        del messages[: -self.max_messages]
+        self._remember(chat_id, seq, messages)
+        return list(messages)
+
+    async def get_messages(self, chat_id: int) -> list[ChatCompletionMessageParam]:
+        cached = self._cache.get(chat_id)
+        if cached is not None:
+            seq = await self.redis.get(self._keys(chat_id)[1])
+            if int(seq or 0) == cached[0]:
+                self._cache.move_to_end(chat_id)
+                return list(cached[1])
+        return list(await self._load(chat_id))
+
+    async def clear(self, chat_id: int) -> None:
+        messages_key, seq_key = self._keys(chat_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(messages_key)
+            pipe.incr(seq_key)
+            _, seq = await pipe.execute()
+        self._remember(chat_id, seq, [])
+
+    async def close(self) -> None:
+        await self.redis.aclose()
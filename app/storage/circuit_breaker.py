@@ -0,0 +1,86 @@
+import time
+from enum import Enum
+from typing import Callable
+
+from app.utils.logger import logger
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend while its circuit is open"""
+
+    pass
+
+
+StateListener = Callable[[str, CircuitState, CircuitState], None]
+
+
+class CircuitBreaker:
+    """Stops calling a failing backend and probes it again after a cool down.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast. Once `reset_timeout` seconds have passed a single probe call is
+    let through (half open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._listeners: list[StateListener] = []
+
+    def add_listener(self, listener: StateListener) -> None:
+        """Register a callback called with (name, old_state, new_state)"""
+        self._listeners.append(listener)
+
+    def _transition(self, state: CircuitState) -> None:
+        if state == self.state:
+            return
+        old_state, self.state = self.state, state
+        logger.warning(
+            f"Circuit {self.name} changed from {old_state.value} to {state.value}"
+        )
+        for listener in self._listeners:
+            try:
+                listener(self.name, old_state, state)
+            except Exception as e:
+                logger.error(f"Circuit {self.name} listener failed: {e}")
+
+    def before_call(self) -> None:
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit {self.name} is open")
+            self._transition(CircuitState.HALF_OPEN)
+        if self.state == CircuitState.HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError(f"Circuit {self.name} is probing")
+            self._probing = True
+
+    def release_probe(self) -> None:
+        """End a call that neither succeeded nor failed, e.g. a cancelled one,
+        so the next call can probe instead"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probing = False
+        self._transition(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if (
+            self.state == CircuitState.HALF_OPEN
+            or self._failures >= self.failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._transition(CircuitState.OPEN)
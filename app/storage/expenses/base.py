@@ -1,12 +1,26 @@
 from abc import ABC, abstractmethod
+from datetime import date
 from typing import List
 
 from app.models.expense import Expense
+from app.storage.sqlite_mirror import QueryPage
 
 
 class ExpenseStorageInterface(ABC):
+    async def start(self) -> None:
+        """Start background work, called once the event loop is running"""
+        pass
+
+    async def close(self) -> None:
+        """Flush pending writes and stop background work"""
+        pass
+
+    def version(self) -> int | None:
+        """Counter bumped on every change to the expenses, None if not tracked"""
+        return None
+
     @abstractmethod
-    def reload_cache(self) -> None:
+    async def reload_cache(self) -> None:
         pass
 
     @abstractmethod
@@ -22,5 +36,27 @@ class ExpenseStorageInterface(ABC):
         pass
 
     @abstractmethod
-    async def get_expenses(self, force_reload: bool = False) -> List[Expense]:
+    async def update_expenses(self, expenses: list[Expense]) -> None:
+        pass
+
+    @abstractmethod
+    async def get_expenses(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> List[Expense]:
+        pass
+
+    async def get_latest_expenses(self, n: int) -> List[Expense]:
+        """The `n` most recent expenses, oldest first"""
+        expenses = await self.get_expenses()
+        return expenses[-n:] if n > 0 else []
+
+    @abstractmethod
+    async def get_expense(self, expense_id: str) -> Expense | None:
+        pass
+
+    @abstractmethod
+    async def query_expenses_page(
+        self, sql: str, offset: int, limit: int, timeout: float
+    ) -> QueryPage:
+        """Page of a query result, aborted with TimeoutError after `timeout` seconds"""
         pass
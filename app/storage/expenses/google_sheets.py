@@ -1,16 +1,27 @@
 import json
-from datetime import datetime
+from datetime import date, datetime
 from zoneinfo import ZoneInfo
 
+from gspread.worksheet import Worksheet
+
 from app.models.expense import Expense
 from app.storage.expenses.base import ExpenseStorageInterface
 from app.storage.google_sheets_mixin import GoogleSheetsMixin
+from app.storage.sqlite_mirror import QueryPage, model_to_sql_row
 from app.utils.config import settings
 
 
 class GSpreadExpenseStorage(GoogleSheetsMixin[Expense], ExpenseStorageInterface):
-    def __init__(self):
-        super().__init__(settings.EXPENSES_SHEET_ID, settings.EXPENSES_SHEET_NAME)
+    MODEL = Expense
+    TABLE_NAME = "expenses"
+    ID_FIELD = "expense_id"
+    AMOUNT_FIELD = "cost"
+    SQL_COLUMNS = list(Expense.model_fields)
+
+    def __init__(self, worksheet: Worksheet | None = None):
+        super().__init__(
+            settings.EXPENSES_SHEET_ID, settings.EXPENSES_SHEET_NAME, worksheet
+        )
 
     @property
     def _item_type_name(self) -> str:
@@ -31,6 +42,9 @@ class GSpreadExpenseStorage(GoogleSheetsMixin[Expense], ExpenseStorageInterface)
             json.dumps(expense.metadata) if expense.metadata else "",
         ]
 
+    def _item_to_sql_row(self, expense: Expense) -> dict:
+        return model_to_sql_row(expense)
+
     def _record_to_item(self, record: dict) -> Expense:
         return Expense(
             expense_id=str(record["expense_id"]),
@@ -60,5 +74,21 @@ class GSpreadExpenseStorage(GoogleSheetsMixin[Expense], ExpenseStorageInterface)
     async def update_expense(self, expense: Expense) -> None:
         await self.update_item(expense, "expense_id")
 
-    async def get_expenses(self, force_reload: bool = False) -> list[Expense]:
-        return await self.get_items(force_reload)
+    async def update_expenses(self, expenses: list[Expense]) -> None:
+        await self.update_items(expenses, "expense_id")
+
+    async def get_expenses(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> list[Expense]:
+        return await self.get_items(force_reload, since)
+
+    async def get_latest_expenses(self, n: int) -> list[Expense]:
+        return await self.get_latest_items(n)
+
+    async def get_expense(self, expense_id: str) -> Expense | None:
+        return await self.get_item(expense_id)
+
+    async def query_expenses_page(
+        self, sql: str, offset: int, limit: int, timeout: float
+    ) -> QueryPage:
+        return await self.query_page(sql, offset, limit, timeout)
@@ -0,0 +1,46 @@
+from datetime import date
+
+from app.models.expense import Expense
+from app.storage.expenses.base import ExpenseStorageInterface
+from app.storage.expenses.google_sheets import GSpreadExpenseStorage
+from app.storage.sqlite_mirror import QueryPage
+from app.storage.sqlite_mixin import SQLiteMixin
+from app.utils.config import settings
+
+
+class SQLiteExpenseStorage(SQLiteMixin[Expense], ExpenseStorageInterface):
+    MODEL = Expense
+    TABLE_NAME = "expenses"
+    ID_FIELD = "expense_id"
+    SQL_COLUMNS = list(Expense.model_fields)
+
+    def __init__(self, export: GSpreadExpenseStorage | None = None):
+        super().__init__(settings.SQLITE_PATH, export)
+
+    async def add_expense(self, expense: Expense) -> None:
+        await self.add_item(expense)
+
+    async def add_expenses(self, expenses: list[Expense]) -> None:
+        await self.add_items(expenses)
+
+    async def update_expense(self, expense: Expense) -> None:
+        await self.update_item(expense, "expense_id")
+
+    async def update_expenses(self, expenses: list[Expense]) -> None:
+        await self.update_items(expenses, "expense_id")
+
+    async def get_expenses(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> list[Expense]:
+        return await self.get_items(force_reload, since)
+
+    async def get_latest_expenses(self, n: int) -> list[Expense]:
+        return await self.get_latest_items(n)
+
+    async def get_expense(self, expense_id: str) -> Expense | None:
+        return await self.get_item(expense_id)
+
+    async def query_expenses_page(
+        self, sql: str, offset: int, limit: int, timeout: float
+    ) -> QueryPage:
+        return await self.query_page(sql, offset, limit, timeout)
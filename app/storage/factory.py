@@ -0,0 +1,35 @@
+from app.storage.chat.base import ChatStorageInterface
+from app.storage.chat.jsonl_chat import JsonlChatStorage
+from app.storage.chat.redis_chat import RedisChatStorage
+from app.storage.expenses.base import ExpenseStorageInterface
+from app.storage.expenses.google_sheets import GSpreadExpenseStorage
+from app.storage.expenses.sqlite import SQLiteExpenseStorage
+from app.storage.incomes.base import IncomeStorageInterface
+from app.storage.incomes.google_sheets import GSpreadIncomeStorage
+from app.storage.incomes.sqlite import SQLiteIncomeStorage
+from app.utils.config import settings
+
+
+def create_expense_storage() -> ExpenseStorageInterface:
+    """Create the expense storage selected by STORAGE_BACKEND"""
+    if settings.STORAGE_BACKEND == "sqlite":
+        return SQLiteExpenseStorage(
+            export=GSpreadExpenseStorage() if settings.SQLITE_EXPORT_TO_SHEETS else None
+        )
+    return GSpreadExpenseStorage()
+
+
+def create_income_storage() -> IncomeStorageInterface:
+    """Create the income storage selected by STORAGE_BACKEND"""
+    if settings.STORAGE_BACKEND == "sqlite":
+        return SQLiteIncomeStorage(
+            export=GSpreadIncomeStorage() if settings.SQLITE_EXPORT_TO_SHEETS else None
+        )
+    return GSpreadIncomeStorage()
+
+
+def create_chat_storage() -> ChatStorageInterface:
+    """Create the chat storage selected by CHAT_BACKEND"""
+    if settings.CHAT_BACKEND == "redis":
+        return RedisChatStorage()
+    return JsonlChatStorage()
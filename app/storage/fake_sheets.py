@@ -0,0 +1,209 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Any
+
+from gspread.cell import Cell
+from gspread.exceptions import APIError
+from gspread.utils import column_letter_to_index, numericise_all, to_records
+from gspread.worksheet import ValueRange
+from requests import Response
+from requests.exceptions import ConnectionError
+
+A1_RANGE = re.compile(r"^([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+
+def _api_error(status: int, retry_after: float | None = None) -> APIError:
+    response = Response()
+    response.status_code = status
+    response._content = json.dumps(
+        {"error": {"code": status, "message": "Injected fault", "status": "FAKE"}}
+    ).encode()
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return APIError(response)
+
+
+class FakeWorksheet:
+    """In-process stand-in for the gspread Worksheet calls the storages make.
+
+    Rows are kept in memory as strings, like Sheets returns them. Every call
+    sleeps for `latency` seconds (on the calling thread, as the real client
+    blocks) and can fail at random with a 429 or a dropped connection. Faults
+    can also be scripted with `fail_next`. Calls are counted in `calls`.
+    """
+
+    def __init__(
+        self,
+        rows: list[list] | None = None,
+        latency: float = 0.0,
+        quota_error_rate: float = 0.0,
+        connection_error_rate: float = 0.0,
+        retry_after: float | None = None,
+        seed: int | None = None,
+    ):
+        self.rows: list[list[str]] = [[str(v) for v in row] for row in rows or []]
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.connection_error_rate = connection_error_rate
+        self.retry_after = retry_after
+        self.calls: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        self._faults: deque[tuple[int | None, bool]] = deque()
+        self._lock = threading.Lock()
+
+    def fail_next(
+        self, status: int | None = None, count: int = 1, applied: bool = False
+    ) -> None:
+        """Fail the next `count` calls with an API error of `status`, or with a
+        dropped connection if `status` is None. With `applied` the call takes
+        effect before failing, like a response lost on the way back.
+        """
+        self._faults.extend([(status, applied)] * count)
+
+    def _call(self, operation: str) -> tuple[int | None, bool] | None:
+        """Account for a call and return the fault to raise, if any"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[operation] += 1
+            if self._faults:
+                return self._faults.popleft()
+            roll = self._random.random()
+        if roll < self.quota_error_rate:
+            return (429, False)
+        if roll < self.quota_error_rate + self.connection_error_rate:
+            return (None, False)
+        return None
+
+    def _raise(self, fault: tuple[int | None, bool] | None) -> None:
+        if fault is None:
+            return
+        status, _ = fault
+        if status is None:
+            raise ConnectionError("Injected connection drop")
+        raise _api_error(status, self.retry_after if status == 429 else None)
+
+    def _run(self, operation: str, action: Any) -> Any:
+        fault = self._call(operation)
+        if fault is not None and not fault[1]:
+            self._raise(fault)
+        with self._lock:
+            result = action()
+        self._raise(fault)
+        return result
+
+    def _parse_range(self, range_name: str) -> tuple[int, int, int, int]:
+        """Zero based, end exclusive (start_row, start_col, end_row, end_col)"""
+        match = A1_RANGE.match(range_name)
+        if match is None:
+            raise _api_error(400)
+        start_col, start_row, end_col, end_row = match.groups()
+        top = int(start_row) - 1 if start_row else 0
+        left = column_letter_to_index(start_col) - 1
+        if end_col is None:
+            bottom = top + 1 if start_row else len(self.rows)
+            right = left + 1
+        else:
+            bottom = int(end_row) if end_row else len(self.rows)
+            right = column_letter_to_index(end_col)
+        return top, left, bottom, right
+
+    def _read(self, range_name: str | None, pad_values: bool) -> ValueRange:
+        if range_name is None:
+            top, left, bottom, right = 0, 0, len(self.rows), None
+        else:
+            top, left, bottom, right = self._parse_range(range_name)
+        values = [row[left:right] for row in self.rows[top:bottom]]
+        if not pad_values:
+            values = [self._strip(row) for row in values]
+        else:
+            width = max((len(row) for row in values), default=0)
+            values = [row + [""] * (width - len(row)) for row in values]
+        return ValueRange.from_json(
+            {"range": range_name or "", "majorDimension": "ROWS", "values": values}
+        )
+
+    @staticmethod
+    def _strip(row: list[str]) -> list[str]:
+        while row and row[-1] == "":
+            row = row[:-1]
+        return row
+
+    def _write(self, range_name: str, values: list[list]) -> None:
+        top, left, _, _ = self._parse_range(range_name)
+        for i, row in enumerate(values):
+            while len(self.rows) <= top + i:
+                self.rows.append([])
+            target = self.rows[top + i]
+            if len(target) < left + len(row):
+                target.extend([""] * (left + len(row) - len(target)))
+            target[left : left + len(row)] = [str(v) for v in row]
+
+    def get(
+        self, range_name: str | None = None, pad_values: bool = False, **kwargs: Any
+    ) -> ValueRange:
+        return self._run("get", lambda: self._read(range_name, pad_values))
+
+    def batch_get(self, ranges: list[str], **kwargs: Any) -> list[ValueRange]:
+        return self._run(
+            "batch_get", lambda: [self._read(name, False) for name in ranges]
+        )
+
+    def get_all_values(self, **kwargs: Any) -> list[list[str]]:
+        return self._run("get_all_values", lambda: [list(row) for row in self.rows])
+
+    def get_all_records(self, **kwargs: Any) -> list[dict]:
+        def records() -> list[dict]:
+            if not self.rows:
+                return []
+            width = len(self.rows[0])
+            rows = [row + [""] * (width - len(row)) for row in self.rows[1:]]
+            return to_records(self.rows[0], [numericise_all(row) for row in rows])
+
+        return self._run("get_all_records", records)
+
+    def append_row(self, values: list, **kwargs: Any) -> dict:
+        return self.append_rows([values], _operation="append_row")
+
+    def append_rows(
+        self, values: list[list], _operation: str = "append_rows", **kwargs: Any
+    ) -> dict:
+        def append() -> dict:
+            self.rows.extend([str(v) for v in row] for row in values)
+            return {"updates": {"updatedRows": len(values)}}
+
+        return self._run(_operation, append)
+
+    def find(
+        self, query: str, in_column: int | None = None, **kwargs: Any
+    ) -> Cell | None:
+        def search() -> Cell | None:
+            for i, row in enumerate(self.rows):
+                columns = [in_column - 1] if in_column else range(len(row))
+                for j in columns:
+                    if j < len(row) and row[j] == query:
+                        return Cell(i + 1, j + 1, row[j])
+            return None
+
+        return self._run("find", search)
+
+    def update(
+        self, values: list[list], range_name: str | None = None, **kwargs: Any
+    ) -> dict:
+        def update() -> dict:
+            self._write(range_name or "A1", values)
+            return {"updatedRange": range_name or "A1"}
+
+        return self._run("update", update)
+
+    def batch_update(self, data: list[dict], **kwargs: Any) -> dict:
+        def update() -> dict:
+            for entry in data:
+                self._write(entry["range"], entry["values"])
+            return {"totalUpdatedRanges": len(data)}
+
+        return self._run("batch_update", update)
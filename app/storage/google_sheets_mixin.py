@@ -1,28 +1,167 @@
+import asyncio
+import gc
+import hashlib
+import json
+import random
+import re
 import time
 from abc import ABC, abstractmethod
-from typing import Any, Generic, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import partial
+from typing import Any, Generic, Iterator, Literal, TypeVar, get_args, get_origin
+from zoneinfo import ZoneInfo
 
+import numpy as np
 from gspread.auth import service_account
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1, to_records
+from gspread.worksheet import Worksheet
 from requests.exceptions import ConnectionError, RequestException
 
+from app.storage.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+from app.storage.indexed_cache import IndexedCache
+from app.storage.sqlite_mirror import QueryPage, SQLiteMirror
+from app.storage.write_journal import WriteJournal
 from app.utils.config import settings
 from app.utils.logger import logger
+from app.utils.metrics import metrics
 
 T = TypeVar("T")  # This will be either Expense or Income
 
 SCOPE = "https://www.googleapis.com/auth/spreadsheets"
+SYNC_BLOCK_SIZE = 200  # rows per checksum block used by the incremental sync
+
+WriteOp = Literal["add", "update"]
+
+# Value of the sheets_circuit_state gauge for each state, to alert on
+CIRCUIT_STATE_VALUES = {
+    CircuitState.CLOSED: 0,
+    CircuitState.HALF_OPEN: 1,
+    CircuitState.OPEN: 2,
+}
+
+MADRID_TZ = ZoneInfo("Europe/Madrid")
+SHEET_TIMESTAMP = re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}")
+
+# gspread is blocking, so every Sheets call runs on this bounded pool instead of
+# the event loop, which is shared with Telegram polling and the API
+SHEETS_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.SHEETS_MAX_WORKERS, thread_name_prefix="sheets"
+)
+
+
+def _retry_after_seconds(value: str | None) -> float | None:
+    """Seconds of a Retry-After header, given as seconds or as an HTTP date.
+    None if it is missing or cannot be parsed"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def strip_thousands(value: Any) -> Any:
+    """Amount without the thousands separators Sheets formats it with, e.g.
+    "1,234.50", as gspread's numericise did"""
+    return value.replace(",", "") if isinstance(value, str) else value
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """Pause the garbage collector while building many long-lived objects.
+
+    Every allocation threshold crossed would otherwise trigger a collection
+    that walks the whole cache without finding any garbage.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 
 class GoogleSheetsMixin(Generic[T], ABC):
-    MAX_RETRIES = 3
-    RETRY_DELAY = 1  # seconds
+    MAX_RETRIES = 5
+    RETRY_DELAY = 1  # seconds, base of the exponential backoff
+    QUOTA_RETRY_DELAY = 10  # seconds, base backoff after a 429 response
+    MAX_RETRY_DELAY = 60  # seconds
 
-    def __init__(self, sheet_id: str, worksheet_name: str):
-        self._client = service_account(settings.GOOGLE_SHEETS_CREDENTIALS, [SCOPE])
-        self._sheet = self._client.open_by_key(sheet_id)
-        self._worksheet = self._sheet.worksheet(worksheet_name)
-        self._cache: list[T] = []
-        self.reload_cache()
+    # Item model and SQL mirror of the cache, defined by each storage
+    MODEL: type[T]
+    TABLE_NAME: str
+    ID_FIELD: str
+    AMOUNT_FIELD: str
+    SQL_COLUMNS: list[str]
+    SQL_INDEXES: tuple[str, ...] = ("timestamp", "category", "sender", "payment_method")
+
+    def __init__(
+        self, sheet_id: str, worksheet_name: str, worksheet: Worksheet | None = None
+    ):
+        self._sheet_id = sheet_id
+        self._worksheet_name = worksheet_name
+        # A worksheet can be injected, e.g. a FakeWorksheet for tests and benchmarks
+        self._injected_worksheet = worksheet
+        self._connect()
+        self.circuit_breaker = CircuitBreaker(
+            f"sheets:{self.TABLE_NAME}",
+            failure_threshold=settings.SHEETS_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.SHEETS_BREAKER_RESET_TIMEOUT,
+        )
+        self.circuit_breaker.add_listener(self._record_circuit_state)
+        metrics.set(
+            "sheets_circuit_state",
+            CIRCUIT_STATE_VALUES[self.circuit_breaker.state],
+            table=self.TABLE_NAME,
+        )
+        self._cache: IndexedCache[T] = IndexedCache(self.ID_FIELD)
+        # Sync state: header, item ids in sheet order and a checksum per row block
+        self._header: list[str] = []
+        self._row_ids: list[str] = []
+        self._block_checksums: list[str] = []
+        self._dirty_from: int | None = None
+        # When every block was last checked against the sheet (time.monotonic)
+        self._verified_at = 0.0
+        # id -> sheet row
+        self._row_index: dict[str, int] = {}
+        self._mirror = SQLiteMirror(
+            self.TABLE_NAME, self.SQL_COLUMNS, self.ID_FIELD, self.SQL_INDEXES
+        )
+        # Write-behind: writes are journaled and acknowledged, then flushed in batches
+        self._journal = WriteJournal(
+            f"{settings.SHEETS_JOURNAL_DIR}/{self.TABLE_NAME}.jsonl"
+        )
+        self._pending: list[tuple[WriteOp, T]] = [
+            (entry["op"], self.MODEL.model_validate(entry["item"]))  # type: ignore
+            for entry in self._journal.read()
+        ]
+        if self._pending:
+            logger.info(f"Replaying {len(self._pending)} journaled writes")
+        # Guards the sheet I/O and the sync state: reloads, syncs and flushes
+        self._lock = asyncio.Lock()
+        # Keeps the mirror writes, which run in threads, in the cache's order
+        self._mirror_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+        self._closing = False
+        # Set when an append failed in a way that it may still have been applied
+        self._outcome_unknown = False
 
     @abstractmethod
     def _item_to_row(self, item: T) -> list[str | float | bool]:
@@ -34,71 +173,630 @@ class GoogleSheetsMixin(Generic[T], ABC):
         """Convert a Google Sheets record to an item"""
         pass
 
-    def _execute_with_retry(self, operation: callable, **kargs: Any) -> Any:
-        """Execute a Google Sheets operation with retry logic."""
+    @abstractmethod
+    def _item_to_sql_row(self, item: T) -> dict:
+        """Convert an item to a row of the SQL mirror"""
+        pass
+
+    def _pad_rows(self, rows: list[list]) -> list[list]:
+        """Rows padded to the header width. Blank rows are kept as placeholders,
+        so positions match sheet rows, but trailing ones are dropped"""
+        width = len(self._header)
+        end = len(rows)
+        while end and not any(rows[end - 1]):
+            end -= 1
+        return [
+            row if len(row) == width else list(row) + [""] * (width - len(row))
+            for row in rows[:end]
+        ]
+
+    @staticmethod
+    def _data_rows(rows: list[list]) -> list[list]:
+        return [row for row in rows if any(row)]
+
+    def _rows_to_items(self, rows: list[list]) -> tuple[list[T], list[dict]]:
+        """Decode sheet rows into items and their rows for the SQL mirror"""
+        if not rows:
+            return [], []
+        try:
+            with gc_paused():
+                return self._decode_rows(rows)
+        except (KeyError, ValueError) as e:
+            # The row by row path raises with the offending row if it is invalid
+            logger.warning(f"Bulk decoding failed, decoding row by row: {e}")
+            items = []
+            for record in to_records(self._header, rows):
+                record[self.AMOUNT_FIELD] = strip_thousands(record[self.AMOUNT_FIELD])
+                items.append(self._record_to_item(record))
+            return items, [self._item_to_sql_row(item) for item in items]
+
+    def _decode_sheet(
+        self, rows: list[list]
+    ) -> tuple[IndexedCache[T], list[dict], list[str]]:
+        """A cache of the items, their mirror rows and the block checksums of
+        all sheet rows. Only reads its arguments, so it can run in a thread."""
+        items, sql_rows = self._rows_to_items(self._data_rows(rows))
+        cache: IndexedCache[T] = IndexedCache(self.ID_FIELD)
+        with gc_paused():
+            cache.replace_all(items)
+        return cache, sql_rows, self._block_checksums_for(rows)
+
+    def _parse_timestamps(self, values: tuple[str, ...]) -> list[datetime]:
+        """Parse "%d/%m/%Y %H:%M:%S" timestamps as Madrid time in one numpy pass"""
+        if not all(SHEET_TIMESTAMP.fullmatch(value) for value in values):
+            raise ValueError("Unexpected timestamp format")
+        iso = np.array(
+            [f"{v[6:10]}-{v[3:5]}-{v[:2]}T{v[11:]}" for v in values],
+            dtype="datetime64[s]",
+        )
+        return [timestamp.replace(tzinfo=MADRID_TZ) for timestamp in iso.astype(object)]
+
+    def _allowed_values(self, field: str) -> set:
+        """Values of a Literal field, None included if it is optional"""
+        annotation = self.MODEL.model_fields[field].annotation  # type: ignore
+        options = (
+            [annotation] if get_origin(annotation) is Literal else get_args(annotation)
+        )
+        values: set = set()
+        for option in options:
+            if get_origin(option) is Literal:
+                values.update(get_args(option))
+            elif option is type(None):
+                values.add(None)
+        return values
+
+    def _decode_rows(self, rows: list[list]) -> tuple[list[T], list[dict]]:
+        """Decode sheet rows column by column.
+
+        Timestamps and amounts are parsed in one vectorized pass each and the
+        constrained columns are checked up front, so the items are built
+        without validating each row again. The mirror rows reuse the sheet
+        values instead of serializing the items back. Raises ValueError if a
+        column does not validate.
+        """
+        columns = dict(zip(self._header, zip(*rows)))
+        timestamps = self._parse_timestamps(columns["timestamp"])
+        amounts = np.array(
+            [strip_thousands(value) for value in columns[self.AMOUNT_FIELD]],
+            dtype=float,
+        ).tolist()
+        payment_methods = [value or None for value in columns["payment_method"]]
+        if not set(payment_methods) <= self._allowed_values("payment_method"):
+            raise ValueError("Unexpected payment_method")
+        if not set(columns["input_method"]) <= self._allowed_values("input_method"):
+            raise ValueError("Unexpected input_method")
+
+        fields_set = set(self.MODEL.model_fields)  # type: ignore
+        items: list[T] = []
+        sql_rows: list[dict] = []
+        for (
+            item_id,
+            timestamp,
+            sender,
+            amount,
+            concept,
+            category,
+            details,
+            payment_method,
+            input_method,
+            tags,
+            metadata,
+        ) in zip(
+            columns[self.ID_FIELD],
+            timestamps,
+            columns["sender"],
+            amounts,
+            columns["concept"],
+            columns["category"],
+            columns["details"],
+            payment_methods,
+            columns["input_method"],
+            columns["tags"],
+            columns["metadata"],
+        ):
+            values = {
+                self.ID_FIELD: item_id,
+                "timestamp": timestamp,
+                "sender": sender,
+                self.AMOUNT_FIELD: amount,
+                "concept": concept,
+                "category": category.split("/"),
+                "details": details or None,
+                "payment_method": payment_method,
+                "input_method": input_method,
+                "tags": tags.split(",") if tags else None,
+                "metadata": json.loads(metadata) if metadata else None,
+            }
+            items.append(self._construct(values, set(fields_set)))
+            sql_rows.append(
+                {
+                    **values,
+                    "timestamp": timestamp.isoformat(),
+                    "category": category,
+                    "tags": tags or None,
+                    "metadata": metadata or None,
+                }
+            )
+        return items, sql_rows
+
+    def _construct(self, values: dict, fields_set: set[str]) -> T:
+        """Build an item from already validated values.
+
+        Same as MODEL.model_construct, without its per field default handling,
+        which costs more than validating.
+        """
+        item = self.MODEL.__new__(self.MODEL)  # type: ignore
+        object.__setattr__(item, "__dict__", values)
+        object.__setattr__(item, "__pydantic_fields_set__", fields_set)
+        object.__setattr__(item, "__pydantic_extra__", None)
+        object.__setattr__(item, "__pydantic_private__", None)
+        return item
+
+    def _block_checksums_for(self, rows: list[list]) -> list[str]:
+        return [
+            hashlib.sha1(
+                json.dumps(rows[i : i + SYNC_BLOCK_SIZE], default=str).encode()
+            ).hexdigest()
+            for i in range(0, len(rows), SYNC_BLOCK_SIZE)
+        ]
+
+    def _mark_dirty(self, row_index: int) -> None:
+        """Flag a data row written by us, so the next sync re-reads its block"""
+        if self._dirty_from is None or row_index < self._dirty_from:
+            self._dirty_from = row_index
+
+    def _index_rows(self, start: int = 0) -> None:
+        for i in range(start, len(self._row_ids)):
+            if self._row_ids[i]:
+                self._row_index.setdefault(self._row_ids[i], i + 2)
+
+    async def _rows_holding_ids(self, rows: dict[str, int]) -> dict[str, int]:
+        """The rows whose id cell in the sheet holds their id"""
+        if not rows:
+            return {}
+        cells = await self._execute_with_retry(
+            "batch_get", ranges=[f"A{row}" for row in rows.values()]
+        )
+        return {
+            item_id: row
+            for (item_id, row), cell in zip(rows.items(), cells)
+            if str(cell.first()) == item_id
+        }
+
+    async def _locate_rows(self, item_ids: list[str]) -> dict[str, int]:
+        """Find the sheet row of each id using the row index.
+
+        The rows are always checked against the sheet. If the index is stale it
+        is repaired with an incremental sync, and as a last resort a full
+        reload. Ids that are not in the sheet are left out. Raises RuntimeError
+        if rows still do not hold their ids after the reload, e.g. because the
+        sheet is being edited, rather than writing over other records.
+        """
+        rows: dict[str, int] = {}
+        verified: dict[str, int] = {}
+        for repair in (None, self._sync, self._reload):
+            if repair is not None:
+                logger.warning(f"Row index is stale, repairing with {repair.__name__}")
+                await repair()
+            rows = {
+                item_id: self._row_index[item_id]
+                for item_id in item_ids
+                if item_id in self._row_index
+            }
+            verified = await self._rows_holding_ids(rows)
+            if len(verified) == len(rows) and (
+                len(rows) == len(item_ids) or repair == self._reload
+            ):
+                return rows
+        mismatched = [item_id for item_id in rows if item_id not in verified]
+        raise RuntimeError(
+            f"Rows of {self.ID_FIELD}s {mismatched} do not hold them after a reload"
+        )
+
+    def _backoff(self, attempt: int, base: float) -> float:
+        """Exponential backoff with jitter"""
+        delay = min(self.MAX_RETRY_DELAY, base * 2**attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def _execute_with_retry(
+        self, operation: str, idempotent: bool = True, **kargs: Any
+    ) -> Any:
+        """Execute a worksheet operation, by name, on the thread pool with retry logic.
+
+        Calls go through the circuit breaker. Operations that are not idempotent
+        are not retried when their outcome is unknown (connection errors, 5xx).
+        """
+        loop = asyncio.get_running_loop()
         for attempt in range(self.MAX_RETRIES):
+            self.circuit_breaker.before_call()
             try:
-                return operation(**kargs)
+                with metrics.timer("sheets_request_seconds", operation=operation):
+                    result = await loop.run_in_executor(
+                        SHEETS_EXECUTOR,
+                        partial(getattr(self._worksheet, operation), **kargs),
+                    )
+            except APIError as e:
+                status = e.response.status_code
+                if status != 429 and status < 500:
+                    # Sheets is up, the request itself is wrong
+                    self.circuit_breaker.record_success()
+                    metrics.inc("sheets_errors_total", operation=operation)
+                    logger.error(f"Failed to execute {operation}: {e}")
+                    raise
+                self.circuit_breaker.record_failure()
+                if attempt == self.MAX_RETRIES - 1 or (
+                    status >= 500 and not idempotent
+                ):
+                    metrics.inc("sheets_errors_total", operation=operation)
+                    logger.error(
+                        f"Failed to execute {operation} after {attempt + 1} attempts: {e}"
+                    )
+                    raise
+                if status == 429:
+                    # Quota exceeded, honour Retry-After when Google sends it
+                    retry_after = _retry_after_seconds(
+                        e.response.headers.get("Retry-After")
+                    )
+                    delay = min(
+                        self.MAX_RETRY_DELAY,
+                        retry_after
+                        if retry_after is not None
+                        else self._backoff(attempt, self.QUOTA_RETRY_DELAY),
+                    )
+                else:
+                    delay = self._backoff(attempt, self.RETRY_DELAY)
+                metrics.inc(
+                    "sheets_retries_total",
+                    operation=operation,
+                    reason="quota" if status == 429 else "server_error",
+                )
+                logger.warning(
+                    f"{operation} failed with status {status} (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}"
+                )
+                await asyncio.sleep(delay)
             except (ConnectionError, RequestException) as e:
-                if attempt == self.MAX_RETRIES - 1:
+                self.circuit_breaker.record_failure()
+                if attempt == self.MAX_RETRIES - 1 or not idempotent:
+                    metrics.inc("sheets_errors_total", operation=operation)
                     logger.error(
-                        f"Failed to execute operation after {self.MAX_RETRIES} attempts: {e}"
+                        f"Failed to execute {operation} after {attempt + 1} attempts: {e}"
                     )
                     raise
-                # Try to reconnect to the sheet
-                self._client = service_account(
-                    settings.GOOGLE_SHEETS_CREDENTIALS, [SCOPE]
+                delay = self._backoff(attempt, self.RETRY_DELAY)
+                metrics.inc(
+                    "sheets_retries_total", operation=operation, reason="connection"
                 )
-                self._sheet = self._client.open_by_key(settings.EXPENSES_SHEET_ID)
-                self._worksheet = self._sheet.worksheet(settings.EXPENSES_SHEET_NAME)
-                self.reload_cache()
                 logger.warning(
-                    f"Operation failed (attempt {attempt + 1}), retrying in {self.RETRY_DELAY}s: {e}"
+                    f"{operation} failed (attempt {attempt + 1}), reconnecting and retrying in {delay:.1f}s: {e}"
                 )
-                time.sleep(self.RETRY_DELAY)
+                await asyncio.sleep(delay)
+                # Reconnect only, the cache is still valid for reads and idempotent writes
+                try:
+                    await loop.run_in_executor(SHEETS_EXECUTOR, self._connect)
+                except (ConnectionError, RequestException) as reconnect_error:
+                    logger.warning(
+                        f"Failed to reconnect to the sheet: {reconnect_error}"
+                    )
+            except asyncio.CancelledError:
+                self.circuit_breaker.release_probe()
+                raise
             except Exception as e:
-                logger.error(f"Failed to execute operation: {e}")
+                # Timeouts, credential refresh errors and the like
+                self.circuit_breaker.record_failure()
+                metrics.inc("sheets_errors_total", operation=operation)
+                logger.error(f"Failed to execute {operation}: {e}")
                 raise
+            else:
+                self.circuit_breaker.record_success()
+                return result
+
+    def _connect(self) -> None:
+        if self._injected_worksheet is not None:
+            self._worksheet = self._injected_worksheet
+            return
+        self._client = service_account(settings.GOOGLE_SHEETS_CREDENTIALS, [SCOPE])
+        self._sheet = self._client.open_by_key(self._sheet_id)
+        self._worksheet = self._sheet.worksheet(self._worksheet_name)
+
+    async def _write_appends(self, items: list[T]) -> None:
+        rows = [self._item_to_row(item) for item in items]
+        try:
+            await self._execute_with_retry("append_rows", idempotent=False, values=rows)
+        except (APIError, ConnectionError, RequestException):
+            # The rows may have landed anyway, so sync before writing again
+            self._outcome_unknown = True
+            raise
+        start = len(self._row_ids)
+        self._mark_dirty(start)
+        self._row_ids.extend(getattr(item, self.ID_FIELD) for item in items)
+        self._index_rows(start)
+
+    async def _write_updates(self, items: list[T]) -> list[T]:
+        """Write the items over their rows, returning those not in the sheet"""
+        rows = await self._locate_rows([getattr(item, self.ID_FIELD) for item in items])
+        missing = [item for item in items if getattr(item, self.ID_FIELD) not in rows]
+        if missing:
+            # e.g. an add whose append failed without landing, then was edited
+            logger.warning(
+                f"{len(missing)} updated {self.ID_FIELD}s are not in the sheet, "
+                "appending them instead"
+            )
+        if not rows:
+            return missing
+        await self._execute_with_retry(
+            "batch_update",
+            data=[
+                {
+                    "range": f"A{rows[item_id]}:N{rows[item_id]}",
+                    "values": [self._item_to_row(item)],
+                }
+                for item in items
+                if (item_id := getattr(item, self.ID_FIELD)) in rows
+            ],
+        )
+        for row in rows.values():
+            self._mark_dirty(row - 2)
+        return missing
+
+    async def _upsert_mirror(self, sql_rows: list[dict]) -> None:
+        """Write to the mirror off the event loop, as a slow query holds it"""
+        async with self._mirror_lock:
+            await asyncio.to_thread(self._mirror.upsert, sql_rows)
+
+    async def _apply_to_cache(self, items: list[T]) -> None:
+        self._cache.upsert_many(items)
+        self._record_cache_size()
+        await self._upsert_mirror([self._item_to_sql_row(item) for item in items])
+
+    def _record_circuit_state(
+        self, name: str, old_state: CircuitState, state: CircuitState
+    ) -> None:
+        metrics.set(
+            "sheets_circuit_state", CIRCUIT_STATE_VALUES[state], table=self.TABLE_NAME
+        )
+        metrics.inc(
+            "sheets_circuit_transitions_total", table=self.TABLE_NAME, state=state.value
+        )
+
+    def _record_cache_size(self) -> None:
+        metrics.set("cache_items", len(self._cache), table=self.TABLE_NAME)
+
+    async def _enqueue(self, ops: list[tuple[WriteOp, T]]) -> None:
+        self._journal.append(
+            [{"op": op, "item": item.model_dump(mode="json")} for op, item in ops]  # type: ignore
+        )
+        self._pending.extend(ops)
+        if not settings.SHEETS_WRITE_BEHIND:
+            await self.flush()
+            return
+        self._ensure_flusher()
+        if len(self._pending) >= settings.SHEETS_FLUSH_BATCH_SIZE:
+            self._flush_requested.set()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while not self._closing:
+            # asyncio.timeout rather than wait_for, which on 3.11 can swallow the
+            # cancellation from close() when the event is set at the same time
+            try:
+                async with asyncio.timeout(settings.SHEETS_FLUSH_INTERVAL):
+                    await self._flush_requested.wait()
+            except TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush {len(self._pending)} writes: {e}")
+
+    async def flush(self) -> None:
+        """Write the pending operations to the sheet.
+
+        Operations on the same id are coalesced, so a flush costs at most one
+        append_rows and one batch_update call.
+        """
+        async with self._lock:
+            count = len(self._pending)
+            if not count:
+                return
+            if self._outcome_unknown:
+                # Appends that did land become updates once their rows are indexed
+                await self._sync()
+                self._outcome_unknown = False
+            appends: dict[str, T] = {}
+            updates: dict[str, T] = {}
+            for op, item in self._pending[:count]:
+                item_id = getattr(item, self.ID_FIELD)
+                if item_id in appends:
+                    appends[item_id] = item
+                elif op == "add" and item_id not in self._row_index:
+                    appends[item_id] = item
+                else:
+                    # Also covers replayed adds that reached the sheet before a crash
+                    updates[item_id] = item
+            if appends:
+                await self._write_appends(list(appends.values()))
+            if updates:
+                missing = await self._write_updates(list(updates.values()))
+                if missing:
+                    await self._write_appends(missing)
+            del self._pending[:count]
+            self._journal.rewrite(
+                [
+                    {"op": op, "item": item.model_dump(mode="json")}  # type: ignore
+                    for op, item in self._pending
+                ]
+            )
+            logger.info(
+                f"Flushed {count} writes: {len(appends)} appended and {len(updates)} updated"
+            )
+
+    async def start(self) -> None:
+        await self.reload_cache()
+        self._ensure_flusher()
+        if self._pending:
+            self._flush_requested.set()
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            # Let the flusher finish its current flush rather than cancelling it
+            # mid-write, which would leave the outcome of an append unknown
+            self._closing = True
+            self._flush_requested.set()
+            await self._flusher
+        await self.flush()
 
     async def add_item(self, item: T) -> None:
-        row = self._item_to_row(item)
-        self._execute_with_retry(self._worksheet.append_row, values=row)
-        self._cache.append(item)
-        self._cache.sort(key=lambda x: x.timestamp, reverse=False)  # type: ignore
+        await self.add_items([item])
 
     async def add_items(self, items: list[T]) -> None:
-        rows = [self._item_to_row(item) for item in items]
-        self._execute_with_retry(self._worksheet.append_rows, values=rows)
-        self._cache.extend(items)
-        self._cache.sort(key=lambda x: x.timestamp, reverse=False)  # type: ignore
+        await self._apply_to_cache(items)
+        await self._enqueue([("add", item) for item in items])
 
     async def update_item(self, item: T, id_field: str) -> None:
-        item_id = getattr(item, id_field)
-        cell = self._execute_with_retry(
-            self._worksheet.find, query=item_id, in_column=1
-        )
-        if not cell:
-            raise ValueError(f"{id_field} with ID {item_id} not found")
-
-        range_name = f"A{cell.row}:N{cell.row}"
-        updated_row = self._item_to_row(item)
-        self._execute_with_retry(
-            self._worksheet.update, range_name=range_name, values=[updated_row]
-        )
-        for i, cached_item in enumerate(self._cache):
-            if getattr(cached_item, id_field) == item_id:
-                self._cache[i] = item
-                break
-
-    async def get_items(self, force_reload: bool = False) -> list[T]:
-        if not force_reload:
-            return self._cache
-        self.reload_cache()
-        return self._cache
-
-    def reload_cache(self) -> None:
+        await self.update_items([item], id_field)
+
+    async def update_items(self, items: list[T], id_field: str) -> None:
+        for item in items:
+            if getattr(item, id_field) not in self._cache:
+                raise ValueError(
+                    f"{id_field} with ID {getattr(item, id_field)} not found"
+                )
+        await self._apply_to_cache(items)
+        await self._enqueue([("update", item) for item in items])
+
+    async def query_page(
+        self, sql: str, offset: int, limit: int, timeout: float
+    ) -> QueryPage:
+        return await asyncio.to_thread(
+            self._mirror.query_page, sql, offset, limit, timeout
+        )
+
+    async def get_items(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> list[T]:
+        """Items ordered by timestamp, optionally only those on or after `since`"""
+        if force_reload:
+            try:
+                await self.sync_cache()
+            except CircuitOpenError as e:
+                logger.warning(f"Serving cached {self.TABLE_NAME} without syncing: {e}")
+        if since is None:
+            return self._cache.items()
+        start = datetime.combine(since, datetime.min.time()).replace(tzinfo=MADRID_TZ)
+        return self._cache.between(start)
+
+    async def get_latest_items(self, n: int) -> list[T]:
+        """The `n` most recent items, oldest first"""
+        return self._cache.last(n)
+
+    def version(self) -> int:
+        return self._cache.version
+
+    async def get_item(self, item_id: str) -> T | None:
+        return self._cache.get(item_id)
+
+    async def reload_cache(self) -> None:
+        async with self._lock:
+            await self._reload()
+
+    async def sync_cache(self) -> None:
+        """Incrementally sync the cache with the sheet.
+
+        Only the last checksum block (or the first block we wrote to) onwards is
+        read: changed blocks are re-parsed and appended rows are added. Every
+        SHEETS_VERIFY_INTERVAL seconds the whole sheet is read instead, so edits
+        to older rows are picked up too. If the rows no longer line up with the
+        known ids, a full reload is done instead.
+        """
+        async with self._lock:
+            await self._sync()
+
+    async def _reload(self) -> None:
         logger.info("Reloading cache")
-        records = self._execute_with_retry(self._worksheet.get_all_records, head=1)
-        logger.info(f"Found {len(records)} records")
-        self._cache = [self._record_to_item(record) for record in records]
-        self._cache.sort(key=lambda x: x.timestamp, reverse=False)  # type: ignore
+        with metrics.timer("cache_reload_seconds", table=self.TABLE_NAME):
+            await self._reload_rows()
+        self._record_cache_size()
+
+    async def _reload_rows(self) -> None:
+        values = await self._execute_with_retry("get_all_values")
+        self._header = [str(key) for key in values[0]] if values else []
+        rows = self._pad_rows(values[1:])
+        # Decoding the whole sheet takes a while, keep the loop serving meanwhile
+        cache, sql_rows, checksums = await asyncio.to_thread(self._decode_sheet, rows)
+        logger.info(f"Found {len(cache)} records")
+        async with self._mirror_lock:
+            await asyncio.to_thread(self._mirror.replace_all, sql_rows)
+        with gc_paused():
+            self._cache.replace_with(cache)
+            self._row_ids = [str(row[0]) for row in rows]
+            self._row_index = {}
+            self._index_rows()
+            self._block_checksums = checksums
+            self._dirty_from = None
+            self._verified_at = time.monotonic()
+        if self._pending:
+            await self._apply_to_cache([item for _, item in self._pending])
+
+    async def _sync(self) -> None:
+        if not self._header:
+            await self._reload()
+            return
+
+        last_block = max(len(self._block_checksums) - 1, 0)
+        if self._dirty_from is not None:
+            last_block = min(last_block, self._dirty_from // SYNC_BLOCK_SIZE)
+        if time.monotonic() - self._verified_at >= settings.SHEETS_VERIFY_INTERVAL:
+            last_block = 0
+        start = last_block * SYNC_BLOCK_SIZE
+        last_column = rowcol_to_a1(1, len(self._header)).rstrip("0123456789")
+        values = await self._execute_with_retry(
+            "get",
+            range_name=f"A{start + 2}:{last_column}",
+            pad_values=True,
+        )
+        rows = self._pad_rows(values)
+
+        known_ids = self._row_ids[start:]
+        if [str(row[0]) for row in rows[: len(known_ids)]] != known_ids:
+            logger.info("Sheet rows diverged from the cache, doing a full reload")
+            await self._reload()
+            return
+
+        checksums = self._block_checksums_for(rows[: len(known_ids)])
+        changed_rows: list[list] = []
+        for i, checksum in enumerate(checksums):
+            block = last_block + i
+            if (
+                block >= len(self._block_checksums)
+                or checksum != self._block_checksums[block]
+            ):
+                changed_rows.extend(
+                    rows[i * SYNC_BLOCK_SIZE : (i + 1) * SYNC_BLOCK_SIZE]
+                )
+        changed_items, changed_sql_rows = self._rows_to_items(
+            self._data_rows(changed_rows)
+        )
+        new_items, new_sql_rows = self._rows_to_items(
+            self._data_rows(rows[len(known_ids) :])
+        )
+        logger.info(
+            f"Synced cache: {len(changed_items)} re-read and {len(new_items)} new records"
+        )
+
+        self._cache.upsert_many(changed_items + new_items)
+        self._record_cache_size()
+        self._row_ids.extend(str(row[0]) for row in rows[len(known_ids) :])
+        self._index_rows(start + len(known_ids))
+        self._block_checksums = self._block_checksums[:last_block] + (
+            self._block_checksums_for(rows)
+        )
+        self._dirty_from = None
+        if last_block == 0:
+            self._verified_at = time.monotonic()
+        await self._upsert_mirror(changed_sql_rows + new_sql_rows)
+        if self._pending:
+            await self._apply_to_cache([item for _, item in self._pending])
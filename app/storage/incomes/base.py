@@ -1,13 +1,26 @@
 from abc import ABC, abstractmethod
+from datetime import date
 
 from app.models.income import Income
 
 
 class IncomeStorageInterface(ABC):
+    async def start(self) -> None:
+        """Start background work, called once the event loop is running"""
+        pass
+
+    async def close(self) -> None:
+        """Flush pending writes and stop background work"""
+        pass
+
     @abstractmethod
-    def reload_cache(self) -> None:
+    async def reload_cache(self) -> None:
         pass
 
+    def version(self) -> int | None:
+        """Counter bumped on every change to the incomes, None if not tracked"""
+        return None
+
     @abstractmethod
     async def add_income(self, income: Income) -> None:
         pass
@@ -21,5 +34,15 @@ class IncomeStorageInterface(ABC):
         pass
 
     @abstractmethod
-    async def get_incomes(self, force_reload: bool = False) -> list[Income]:
+    async def update_incomes(self, incomes: list[Income]) -> None:
+        pass
+
+    @abstractmethod
+    async def get_incomes(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> list[Income]:
+        pass
+
+    @abstractmethod
+    async def get_income(self, income_id: str) -> Income | None:
         pass
@@ -1,16 +1,27 @@
 import json
-from datetime import datetime
+from datetime import date, datetime
 from zoneinfo import ZoneInfo
 
+from gspread.worksheet import Worksheet
+
 from app.models.income import Income
 from app.storage.google_sheets_mixin import GoogleSheetsMixin
 from app.storage.incomes.base import IncomeStorageInterface
+from app.storage.sqlite_mirror import model_to_sql_row
 from app.utils.config import settings
 
 
 class GSpreadIncomeStorage(GoogleSheetsMixin[Income], IncomeStorageInterface):
-    def __init__(self):
-        super().__init__(settings.INCOMES_SHEET_ID, settings.INCOMES_SHEET_NAME)
+    MODEL = Income
+    TABLE_NAME = "incomes"
+    ID_FIELD = "income_id"
+    AMOUNT_FIELD = "value"
+    SQL_COLUMNS = list(Income.model_fields)
+
+    def __init__(self, worksheet: Worksheet | None = None):
+        super().__init__(
+            settings.INCOMES_SHEET_ID, settings.INCOMES_SHEET_NAME, worksheet
+        )
 
     @property
     def _item_type_name(self) -> str:
@@ -31,6 +42,9 @@ class GSpreadIncomeStorage(GoogleSheetsMixin[Income], IncomeStorageInterface):
             json.dumps(income.metadata) if income.metadata else "",
         ]
 
+    def _item_to_sql_row(self, income: Income) -> dict:
+        return model_to_sql_row(income)
+
     def _record_to_item(self, record: dict) -> Income:
         return Income(
             income_id=str(record["income_id"]),
@@ -59,5 +73,13 @@ class GSpreadIncomeStorage(GoogleSheetsMixin[Income], IncomeStorageInterface):
     async def update_income(self, income: Income) -> None:
         await self.update_item(income, "income_id")
 
-    async def get_incomes(self, force_reload: bool = False) -> list[Income]:
-        return await self.get_items(force_reload)
+    async def update_incomes(self, incomes: list[Income]) -> None:
+        await self.update_items(incomes, "income_id")
+
+    async def get_incomes(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> list[Income]:
+        return await self.get_items(force_reload, since)
+
+    async def get_income(self, income_id: str) -> Income | None:
+        return await self.get_item(income_id)
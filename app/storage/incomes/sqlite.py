@@ -0,0 +1,37 @@
+from datetime import date
+
+from app.models.income import Income
+from app.storage.incomes.base import IncomeStorageInterface
+from app.storage.incomes.google_sheets import GSpreadIncomeStorage
+from app.storage.sqlite_mixin import SQLiteMixin
+from app.utils.config import settings
+
+
+class SQLiteIncomeStorage(SQLiteMixin[Income], IncomeStorageInterface):
+    MODEL = Income
+    TABLE_NAME = "incomes"
+    ID_FIELD = "income_id"
+    SQL_COLUMNS = list(Income.model_fields)
+
+    def __init__(self, export: GSpreadIncomeStorage | None = None):
+        super().__init__(settings.SQLITE_PATH, export)
+
+    async def add_income(self, income: Income) -> None:
+        await self.add_item(income)
+
+    async def add_incomes(self, incomes: list[Income]) -> None:
+        await self.add_items(incomes)
+
+    async def update_income(self, income: Income) -> None:
+        await self.update_item(income, "income_id")
+
+    async def update_incomes(self, incomes: list[Income]) -> None:
+        await self.update_items(incomes, "income_id")
+
+    async def get_incomes(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> list[Income]:
+        return await self.get_items(force_reload, since)
+
+    async def get_income(self, income_id: str) -> Income | None:
+        return await self.get_item(income_id)
@@ -0,0 +1,91 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Generic, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")  # This will be either Expense or Income
+
+
+class IndexedCache(Generic[T]):
+    """In-memory store of items ordered by timestamp and indexed by id.
+
+    Inserts and timestamp range lookups use bisect on a parallel list of
+    timestamps, and id lookups go through a dict.
+    """
+
+    def __init__(self, id_field: str):
+        self._id_field = id_field
+        self._items: list[T] = []
+        self._timestamps: list[datetime] = []
+        self._by_id: dict[str, T] = {}
+        # Bumped on every change, so derived data can be cached against it
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._items)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._by_id
+
+    def _id(self, item: T) -> str:
+        return getattr(item, self._id_field)
+
+    def replace_all(self, items: Iterable[T]) -> None:
+        self._items = sorted(items, key=lambda x: x.timestamp)  # type: ignore
+        self._timestamps = [item.timestamp for item in self._items]  # type: ignore
+        self._by_id = {}
+        for item in self._items:
+            self._by_id.setdefault(self._id(item), item)
+        self.version += 1
+
+    def replace_with(self, other: "IndexedCache[T]") -> None:
+        """Take over the items of `other`, e.g. a cache filled in a thread"""
+        self._items, self._timestamps, self._by_id = (
+            other._items,
+            other._timestamps,
+            other._by_id,
+        )
+        self.version += 1
+
+    def _remove(self, item: T) -> None:
+        start = bisect_left(self._timestamps, item.timestamp)  # type: ignore
+        end = bisect_right(self._timestamps, item.timestamp)  # type: ignore
+        for i in range(start, end):
+            if self._items[i] is item:
+                del self._items[i]
+                del self._timestamps[i]
+                return
+
+    def upsert(self, item: T) -> None:
+        existing = self._by_id.get(self._id(item))
+        if existing is not None:
+            self._remove(existing)
+        i = bisect_right(self._timestamps, item.timestamp)  # type: ignore
+        self._items.insert(i, item)
+        self._timestamps.insert(i, item.timestamp)  # type: ignore
+        self._by_id[self._id(item)] = item
+        self.version += 1
+
+    def upsert_many(self, items: Iterable[T]) -> None:
+        for item in items:
+            self.upsert(item)
+
+    def get(self, item_id: str) -> T | None:
+        return self._by_id.get(item_id)
+
+    def items(self) -> list[T]:
+        """All items by timestamp. This is the internal list, do not modify it."""
+        return self._items
+
+    def between(
+        self, start: datetime | None = None, end: datetime | None = None
+    ) -> list[T]:
+        """Items with start <= timestamp < end"""
+        i = bisect_left(self._timestamps, start) if start is not None else 0
+        j = bisect_left(self._timestamps, end) if end is not None else len(self._items)
+        return self._items[i:j]
+
+    def last(self, n: int) -> list[T]:
+        return self._items[-n:] if n > 0 else []
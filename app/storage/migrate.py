@@ -0,0 +1,66 @@
+"""Bulk copy expenses and incomes between Google Sheets and SQLite.
+
+Items are upserted by id, so running it again syncs the target with the source:
+
+    python -m app.storage.migrate sheets-to-sqlite
+    python -m app.storage.migrate sqlite-to-sheets
+"""
+
+import argparse
+import asyncio
+
+from app.storage.expenses.google_sheets import GSpreadExpenseStorage
+from app.storage.expenses.sqlite import SQLiteExpenseStorage
+from app.storage.google_sheets_mixin import GoogleSheetsMixin
+from app.storage.incomes.google_sheets import GSpreadIncomeStorage
+from app.storage.incomes.sqlite import SQLiteIncomeStorage
+from app.storage.sqlite_mixin import SQLiteMixin
+from app.utils.logger import logger
+
+BATCH_SIZE = 5000
+
+Storage = GoogleSheetsMixin | SQLiteMixin
+
+
+async def copy_items(source: Storage, target: Storage) -> None:
+    await source.start()
+    await target.start()
+    try:
+        items = await source.get_items()
+        for i in range(0, len(items), BATCH_SIZE):
+            batch = items[i : i + BATCH_SIZE]
+            existing, new = [], []
+            for item in batch:
+                found = await target.get_item(getattr(item, source.ID_FIELD))
+                (existing if found is not None else new).append(item)
+            if new:
+                await target.add_items(new)
+            if existing:
+                await target.update_items(existing, source.ID_FIELD)
+            if isinstance(target, GoogleSheetsMixin):
+                # Keep each append_rows and batch_update request bounded
+                await target.flush()
+            logger.info(
+                f"Copied {i + len(batch)}/{len(items)} {source.TABLE_NAME}: "
+                f"{len(new)} added and {len(existing)} updated"
+            )
+    finally:
+        await target.close()
+        await source.close()
+
+
+async def migrate(direction: str) -> None:
+    sheets: list[Storage] = [GSpreadExpenseStorage(), GSpreadIncomeStorage()]
+    sqlite: list[Storage] = [SQLiteExpenseStorage(), SQLiteIncomeStorage()]
+    pairs = (
+        zip(sheets, sqlite) if direction == "sheets-to-sqlite" else zip(sqlite, sheets)
+    )
+    for source, target in pairs:
+        await copy_items(source, target)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("direction", choices=["sheets-to-sqlite", "sqlite-to-sheets"])
+    args = parser.parse_args()
+    asyncio.run(migrate(args.direction))
@@ -0,0 +1,197 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Iterable, TypeVar
+
+import pandas as pd
+from pydantic import BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+
+SqlRow = dict[str, Any]
+
+# Statements the agent is allowed to run against the mirror
+READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+# SQLite virtual machine instructions between checks of a query deadline
+PROGRESS_STEPS = 10_000
+FETCH_BATCH_SIZE = 1000
+
+
+def _json_datetime(value: datetime) -> str:
+    """Same format as pydantic's JSON serialization of datetimes"""
+    text = value.isoformat()
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+
+def model_to_sql_row(item: BaseModel) -> SqlRow:
+    """Flatten an expense or income into SQL column values"""
+    # Reads the fields directly, model_dump costs more than the rest of a reload
+    return {
+        **vars(item),
+        "timestamp": _json_datetime(item.timestamp),  # type: ignore
+        "category": "/".join(item.category),  # type: ignore
+        "tags": ",".join(item.tags) if item.tags else None,  # type: ignore
+        "metadata": json.dumps(item.metadata) if item.metadata else None,  # type: ignore
+    }
+
+
+def sql_row_to_model(model: type[M], row: SqlRow) -> M:
+    """Inverse of model_to_sql_row"""
+    return model.model_validate(
+        {
+            **row,
+            "category": str(row["category"]).split("/"),
+            "tags": str(row["tags"]).split(",") if row["tags"] else None,
+            "metadata": json.loads(row["metadata"]) if row["metadata"] else None,
+        }
+    )
+
+
+@dataclass
+class QueryPage:
+    """Rows `offset` to `offset + limit` of a query result"""
+
+    frame: pd.DataFrame
+    offset: int
+    # Rows in the whole result, None if counting them ran out of time
+    total: int | None
+
+
+class SQLiteMirror:
+    """Long-lived, indexed SQLite copy of a storage cache.
+
+    The mirror is kept in sync incrementally by the storage, so queries run
+    directly against it instead of rebuilding a database on every call. With
+    `reset=False` an existing table is kept, so it can also be a primary store.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        columns: list[str],
+        primary_key: str,
+        indexes: Iterable[str] = (),
+        path: str = ":memory:",
+        reset: bool = True,
+    ):
+        self.table = table
+        self.columns = columns
+        self.primary_key = primary_key
+        self.indexes = list(indexes)
+        self._to_params = itemgetter(*columns)
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        column_defs = ", ".join(
+            f"{column} TEXT PRIMARY KEY" if column == primary_key else column
+            for column in columns
+        )
+        with self._conn:
+            if reset:
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_defs})")
+            self._create_indexes()
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(
+            f"{column} = excluded.{column}"
+            for column in columns
+            if column != primary_key
+        )
+        self._upsert_sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT ({primary_key}) DO UPDATE SET {updates}"
+        )
+
+    def _create_indexes(self) -> None:
+        for column in self.indexes:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_{column} "
+                f"ON {self.table} ({column})"
+            )
+
+    def replace_all(self, rows: Iterable[SqlRow]) -> None:
+        with self._lock, self._conn:
+            # Building the indexes once after a bulk load is cheaper than
+            # maintaining them on every insert
+            for column in self.indexes:
+                self._conn.execute(f"DROP INDEX IF EXISTS idx_{self.table}_{column}")
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.executemany(
+                self._upsert_sql, (self._to_params(row) for row in rows)
+            )
+            self._create_indexes()
+
+    def upsert(self, rows: Iterable[SqlRow]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                self._upsert_sql, (self._to_params(row) for row in rows)
+            )
+
+    def rows(self) -> list[SqlRow]:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(self.columns)} FROM {self.table}"
+            )
+            return [dict(zip(self.columns, values)) for values in cursor]
+
+    def _authorize(self, action: int, *args: Any) -> int:
+        return sqlite3.SQLITE_OK if action in READ_ONLY_ACTIONS else sqlite3.SQLITE_DENY
+
+    def query_page(
+        self, sql: str, offset: int, limit: int, timeout: float
+    ) -> QueryPage:
+        """Run a read-only query and return a page of its result.
+
+        Only the page is materialized, the rows after it are just counted. A
+        query still running after `timeout` seconds is aborted with a
+        TimeoutError, unless the page is complete and only the count is left.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._conn.set_authorizer(self._authorize)
+            self._conn.set_progress_handler(
+                lambda: time.monotonic() > deadline, PROGRESS_STEPS
+            )
+            try:
+                try:
+                    cursor = self._conn.execute(sql)
+                    columns = [column[0] for column in cursor.description or ()]
+                    skipped = 0
+                    while skipped < offset:
+                        batch = cursor.fetchmany(
+                            min(FETCH_BATCH_SIZE, offset - skipped)
+                        )
+                        if not batch:
+                            break
+                        skipped += len(batch)
+                    rows = cursor.fetchmany(limit)
+                except sqlite3.OperationalError as e:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(
+                            f"Query aborted after {timeout} seconds"
+                        ) from e
+                    raise
+                total: int | None = skipped + len(rows)
+                try:
+                    while batch := cursor.fetchmany(FETCH_BATCH_SIZE):
+                        total += len(batch)  # type: ignore
+                except sqlite3.OperationalError:
+                    total = None
+                return QueryPage(pd.DataFrame(rows, columns=columns), skipped, total)
+            finally:
+                self._conn.set_progress_handler(None, 0)
+                self._conn.set_authorizer(None)
@@ -0,0 +1,134 @@
+import asyncio
+from abc import ABC
+from datetime import date, datetime
+from typing import Generic, TypeVar
+from zoneinfo import ZoneInfo
+
+from app.storage.google_sheets_mixin import GoogleSheetsMixin
+from app.storage.indexed_cache import IndexedCache
+from app.storage.sqlite_mirror import (
+    QueryPage,
+    SQLiteMirror,
+    model_to_sql_row,
+    sql_row_to_model,
+)
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+T = TypeVar("T")  # This will be either Expense or Income
+
+
+class SQLiteMixin(Generic[T], ABC):
+    """Storage backed by a local SQLite database in WAL mode.
+
+    Writes are committed to the database before returning and reads are served
+    from an in-memory cache, like the Google Sheets storages. A Google Sheets
+    storage can be given as `export`, in which case every write is also sent to
+    it (through its write-behind journal) to keep the sheet as a mirror.
+    """
+
+    MODEL: type[T]
+    TABLE_NAME: str
+    ID_FIELD: str
+    SQL_COLUMNS: list[str]
+    SQL_INDEXES: tuple[str, ...] = ("timestamp", "category", "sender", "payment_method")
+
+    def __init__(self, path: str, export: GoogleSheetsMixin[T] | None = None):
+        self._db = SQLiteMirror(
+            self.TABLE_NAME,
+            self.SQL_COLUMNS,
+            self.ID_FIELD,
+            self.SQL_INDEXES,
+            path=path,
+            reset=False,
+        )
+        self._cache: IndexedCache[T] = IndexedCache(self.ID_FIELD)
+        self._export = export
+
+    async def start(self) -> None:
+        await self.reload_cache()
+        if self._export is not None:
+            await self._export.start()
+
+    async def close(self) -> None:
+        if self._export is not None:
+            await self._export.close()
+
+    async def _write(self, items: list[T]) -> None:
+        rows = [model_to_sql_row(item) for item in items]  # type: ignore
+        await asyncio.to_thread(self._db.upsert, rows)
+        self._cache.upsert_many(items)
+        metrics.set("cache_items", len(self._cache), table=self.TABLE_NAME)
+
+    async def _export_items(self, items: list[T]) -> None:
+        if self._export is None:
+            return
+        try:
+            existing, new = [], []
+            for item in items:
+                exported = await self._export.get_item(getattr(item, self.ID_FIELD))
+                (existing if exported is not None else new).append(item)
+            if new:
+                await self._export.add_items(new)
+            if existing:
+                await self._export.update_items(existing, self.ID_FIELD)
+        except Exception as e:
+            # The database is the source of truth, the sheet can be synced later
+            logger.error(f"Failed to export {len(items)} {self.TABLE_NAME}: {e}")
+
+    async def add_item(self, item: T) -> None:
+        await self.add_items([item])
+
+    async def add_items(self, items: list[T]) -> None:
+        await self._write(items)
+        await self._export_items(items)
+
+    async def update_item(self, item: T, id_field: str) -> None:
+        await self.update_items([item], id_field)
+
+    async def update_items(self, items: list[T], id_field: str) -> None:
+        for item in items:
+            if getattr(item, id_field) not in self._cache:
+                raise ValueError(
+                    f"{id_field} with ID {getattr(item, id_field)} not found"
+                )
+        await self._write(items)
+        await self._export_items(items)
+
+    async def query_page(
+        self, sql: str, offset: int, limit: int, timeout: float
+    ) -> QueryPage:
+        return await asyncio.to_thread(self._db.query_page, sql, offset, limit, timeout)
+
+    async def get_items(
+        self, force_reload: bool = False, since: date | None = None
+    ) -> list[T]:
+        """Items ordered by timestamp, optionally only those on or after `since`"""
+        if force_reload:
+            await self.reload_cache()
+        if since is None:
+            return self._cache.items()
+        start = datetime.combine(since, datetime.min.time()).replace(
+            tzinfo=ZoneInfo("Europe/Madrid")
+        )
+        return self._cache.between(start)
+
+    async def get_latest_items(self, n: int) -> list[T]:
+        """The `n` most recent items, oldest first"""
+        return self._cache.last(n)
+
+    def version(self) -> int:
+        return self._cache.version
+
+    async def get_item(self, item_id: str) -> T | None:
+        return self._cache.get(item_id)
+
+    async def reload_cache(self) -> None:
+        with metrics.timer("cache_reload_seconds", table=self.TABLE_NAME):
+            rows = await asyncio.to_thread(self._db.rows)
+            self._cache.replace_all(
+                sql_row_to_model(self.MODEL, row)  # type: ignore
+                for row in rows
+            )
+        metrics.set("cache_items", len(self._cache), table=self.TABLE_NAME)
+        logger.info(f"Loaded {len(self._cache)} {self.TABLE_NAME} from SQLite")
@@ -0,0 +1,50 @@
+import json
+import os
+from pathlib import Path
+
+from app.utils.logger import logger
+
+
+class WriteJournal:
+    """Append-only JSON lines journal of writes that are not yet in storage.
+
+    Every append is fsynced before returning, so acknowledged writes survive a
+    crash or restart and can be replayed on startup.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a", encoding="utf-8")
+
+    def read(self) -> list[dict]:
+        entries = []
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn write from a crash, the write was never acknowledged
+                logger.warning(f"Skipping corrupt entry in journal {self.path}")
+        return entries
+
+    def append(self, entries: list[dict]) -> None:
+        self._file.write(
+            "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        )
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def rewrite(self, entries: list[dict]) -> None:
+        """Atomically replace the journal contents, e.g. after a flush"""
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            f.writelines(
+                json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = self.path.open("a", encoding="utf-8")
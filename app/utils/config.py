@@ -1,6 +1,8 @@
 from functools import lru_cache
+from typing import Literal
 
 from dotenv import load_dotenv
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -19,6 +21,60 @@ class Settings(BaseSettings):
     DEFAULT_LANGUAGE: str
     USER_MAPPING_FILE: str = "user_mapping.json"
 
+    # Storage backend for expenses and incomes. With sqlite, the sheets can be
+    # kept as an export mirror of the database
+    STORAGE_BACKEND: Literal["sheets", "sqlite"] = "sheets"
+    SQLITE_PATH: str = "data/expense_tracker.db"
+    SQLITE_EXPORT_TO_SHEETS: bool = False
+
+    # Google Sheets
+    SHEETS_MAX_WORKERS: int = 4
+    SHEETS_BREAKER_FAILURE_THRESHOLD: int = 5
+    SHEETS_BREAKER_RESET_TIMEOUT: float = 30.0  # seconds
+    SHEETS_WRITE_BEHIND: bool = True
+    SHEETS_JOURNAL_DIR: str = "journal"
+    SHEETS_FLUSH_INTERVAL: float = 2.0  # seconds
+    SHEETS_FLUSH_BATCH_SIZE: int = 50
+    # Seconds between syncs that check every row block for edits made in the
+    # sheet, not only the last ones
+    SHEETS_VERIFY_INTERVAL: float = 3600.0
+
+    # Chat history, one per chat id
+    CHAT_BACKEND: Literal["jsonl", "redis"] = "jsonl"
+    CHAT_HISTORY_DIR: str = "data/chats"
+    CHAT_CACHE_SIZE: int = 32  # chats kept open or cached in memory
+    CHAT_MEMORY_MESSAGES: int = 200  # recent messages kept in memory
+    CHAT_LOG_MAX_MESSAGES: int = 2000  # the log is rotated past this size
+    CHAT_FSYNC_INTERVAL: float = 0.5  # seconds
+    CHAT_CONTEXT_TOKENS: int = 6000  # budget of the history sent to the model
+    CHAT_SUMMARY_BATCH_TOKENS: int = 1500  # left out tokens before re-summarizing
+
+    # Add simple expense messages like "45,60 en Mercadona con tarjeta" without
+    # the model, when the merchant's category is known from earlier expenses
+    FAST_PATH_ENABLED: bool = True
+
+    # Classification of bank statement movements, in chunks sent concurrently
+    CLASSIFICATION_CHUNK_SIZE: int = 25  # movements per request
+    CLASSIFICATION_CONCURRENCY: int = 4  # requests at once
+    CLASSIFICATION_ATTEMPTS: int = 3  # tries for movements left out by the model
+    # Local classifier of near-duplicate statement lines, trained by the worker.
+    # Less confident predictions go to the model
+    CLASSIFIER_NEIGHBOURS: int = 5
+    CLASSIFIER_MIN_CONFIDENCE: float = 0.5
+    # Minutes between trainings, a divisor of 60 as they run at fixed minutes
+    CLASSIFIER_TRAIN_INTERVAL: int = 15
+
+    # Results of the agent's expense queries
+    QUERY_MAX_ROWS: int = 50  # rows per page
+    QUERY_MAX_CHARS: int = 4000  # characters per page
+    QUERY_TIMEOUT: float = 2.0  # seconds before a query is aborted
+
+    # Telegram
+    TELEGRAM_EDIT_INTERVAL: float = 1.0  # seconds between edits of a streamed reply
+    UPDATE_WORKERS: int = 8  # updates of different chats processed at once
+    UPDATE_MAX_PENDING: int = 100  # received updates waiting or in process
+    UPDATE_DRAIN_TIMEOUT: float = 30.0  # seconds to finish updates on shutdown
+
     # Redis
     REDIS_HOST: str
     REDIS_PORT: int
@@ -30,6 +86,13 @@ class Settings(BaseSettings):
         env_file_encoding="utf-8",
     )
 
+    @field_validator("CLASSIFIER_TRAIN_INTERVAL")
+    @classmethod
+    def _divides_hour(cls, value: int) -> int:
+        if value < 1 or 60 % value:
+            raise ValueError("must divide 60 minutes, e.g. 5, 10, 15 or 30")
+        return value
+
     @property
     def TELEGRAM_BOT_TOKEN(self) -> str:
         return (
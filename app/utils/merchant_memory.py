@@ -0,0 +1,57 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from app.models.expense import Expense
+
+NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_merchant(text: str) -> str:
+    """Lowercase, accent and punctuation free form used as memory key"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return NON_WORD.sub(" ", text).strip()
+
+
+class MerchantMemory:
+    """Categories and spellings used so far for each merchant (expense concept).
+
+    A category is only suggested once a merchant has been seen `min_count`
+    times, and `min_share` of its expenses have that category.
+    """
+
+    def __init__(self, min_count: int = 2, min_share: float = 0.8):
+        self.min_count = min_count
+        self.min_share = min_share
+        self._categories: defaultdict[str, Counter[tuple[str, ...]]] = defaultdict(
+            Counter
+        )
+        self._spellings: defaultdict[str, Counter[str]] = defaultdict(Counter)
+
+    def learn(self, concept: str, category: list[str]) -> None:
+        key = normalize_merchant(concept)
+        if not key:
+            return
+        self._categories[key][tuple(category)] += 1
+        self._spellings[key][concept] += 1
+
+    def rebuild(self, expenses: list[Expense]) -> None:
+        self._categories.clear()
+        self._spellings.clear()
+        for expense in expenses:
+            self.learn(expense.concept, expense.category)
+
+    def category(self, merchant: str) -> list[str] | None:
+        counts = self._categories.get(normalize_merchant(merchant))
+        if not counts:
+            return None
+        category, count = counts.most_common(1)[0]
+        if count < self.min_count or count < self.min_share * counts.total():
+            return None
+        return list(category)
+
+    def spelling(self, merchant: str) -> str | None:
+        """Most used spelling of the merchant, e.g. Mercadona for mercadona"""
+        spellings = self._spellings.get(normalize_merchant(merchant))
+        return spellings.most_common(1)[0][0] if spellings else None
@@ -0,0 +1,115 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+# Upper bounds in seconds, for latencies from a cache hit to a long agent turn
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    # Observations per bucket, the last one is for values above every bound
+    counts: list[int] = field(default_factory=lambda: [0] * (len(DEFAULT_BUCKETS) + 1))
+    total: float = 0.0
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _labels(labels: dict[str, object]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Process-wide counters, gauges and histograms, e.g. of tokens used and latencies.
+
+    Every metric can be split by labels, e.g. `inc("tokens", 10, model="gpt")`,
+    and `render` exposes them all in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self.counters: defaultdict[str, defaultdict[Labels, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.histograms: defaultdict[str, defaultdict[Labels, Histogram]] = defaultdict(
+            lambda: defaultdict(Histogram)
+        )
+        self.gauges: defaultdict[str, dict[Labels, float]] = defaultdict(dict)
+
+    def inc(self, name: str, value: float = 1.0, **labels: object) -> None:
+        self.counters[name][_labels(labels)] += value
+
+    def set(self, name: str, value: float, **labels: object) -> None:
+        self.gauges[name][_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        self.histograms[name][_labels(labels)].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: object) -> Iterator[None]:
+        """Observe the seconds spent in the block, also if it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def total(self, name: str) -> float:
+        """Value of a counter summed over all its labels"""
+        return sum(self.counters[name].values())
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        total = self.total(denominator)
+        return self.total(numerator) / total if total else 0.0
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: list[str] = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                bounds = [*map(_format_value, histogram.buckets), "+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels + (("le", bound),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(
+                    f"{name}_sum{_format_labels(labels)} {_format_value(histogram.total)}"
+                )
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,118 @@
+import re
+from collections import Counter
+
+from app.models.expense import Expense
+from app.models.income import Income
+from app.models.movement import Movement
+from app.storage.expenses.base import ExpenseStorageInterface
+from app.storage.incomes.base import IncomeStorageInterface
+from app.utils.merchant_memory import normalize_merchant
+
+STATEMENT_TEXT_KEY = "statement_text"
+PAYMENT_METHODS = ("card", "transfer", "p2p")
+
+# Dates like 12/03, 12-03-24 or 2024.03.12
+DATE = re.compile(r"\b\d{1,4}[/.-]\d{1,2}(?:[/.-]\d{1,4})?\b")
+WORD = re.compile(r"\w+")
+# Words with this many digits are references, card or account numbers
+REFERENCE_DIGITS = 4
+
+# Normalized statement text, and whether the movement is an expense
+CacheKey = tuple[str, bool]
+# Concept, category and payment method
+Classification = tuple[str, tuple[str, ...], str]
+
+
+def normalize_statement_text(text: str) -> str:
+    """Statement text without the dates and references that change between
+    movements of the same merchant"""
+    text = WORD.sub(
+        lambda word: (
+            " " if sum(c.isdigit() for c in word[0]) >= REFERENCE_DIGITS else word[0]
+        ),
+        DATE.sub(" ", text),
+    )
+    return normalize_merchant(text)
+
+
+def classified_statement_text(item: Expense | Income) -> str | None:
+    """Statement text of an expense or income that can be learned from"""
+    text = (item.metadata or {}).get(STATEMENT_TEXT_KEY)
+    if (
+        not isinstance(text, str)
+        or item.payment_method not in PAYMENT_METHODS
+        # Left for the model to try again
+        or item.category[0] == "other"
+    ):
+        return None
+    return text
+
+
+class ClassificationCache:
+    """Classifications of earlier statement movements, by normalized statement text.
+
+    Expenses and incomes keep the statement text they were imported or matched
+    with in their metadata, so the cache is built from the storages and needs
+    no file of its own. It is rebuilt when the storage versions change, which
+    picks up new imports and categories edited since. A text only hits when
+    `min_share` of its movements agree on the concept, category and payment
+    method.
+    """
+
+    def __init__(
+        self,
+        expense_storage: ExpenseStorageInterface,
+        income_storage: IncomeStorageInterface,
+        min_share: float = 0.8,
+    ):
+        self.expense_storage = expense_storage
+        self.income_storage = income_storage
+        self.min_share = min_share
+        self._classifications: dict[CacheKey, Classification] = {}
+        # Normalized form of every statement text seen, so rebuilds only
+        # normalize the new ones
+        self._normalized: dict[str, str] = {}
+        self._versions: tuple[int | None, int | None] | None = None
+
+    async def sync(self) -> None:
+        versions = (self.expense_storage.version(), self.income_storage.version())
+        if None not in versions and versions == self._versions:
+            return
+        self.rebuild(
+            await self.expense_storage.get_expenses()
+            + await self.income_storage.get_incomes()
+        )
+        self._versions = versions
+
+    def rebuild(self, items: list[Expense | Income]) -> None:
+        counts: Counter[tuple[CacheKey, Classification]] = Counter()
+        totals: Counter[CacheKey] = Counter()
+        normalized = self._normalized
+        for item in items:
+            text = classified_statement_text(item)
+            if text is None:
+                continue
+            text_key = normalized.get(text)
+            if text_key is None:
+                text_key = normalized[text] = normalize_statement_text(text)
+            if not text_key:
+                continue
+            key = (text_key, isinstance(item, Expense))
+            counts[
+                (key, (item.concept, tuple(item.category), item.payment_method))
+            ] += 1  # type: ignore
+            totals[key] += 1
+        self._classifications = {
+            key: classification
+            for (key, classification), count in counts.items()
+            if count >= self.min_share * totals[key]
+        }
+
+    def __len__(self) -> int:
+        return len(self._classifications)
+
+    def get(self, movement: Movement) -> Classification | None:
+        return self.lookup(movement.description, movement.amount <= 0)
+
+    def lookup(self, text: str, is_expense: bool) -> Classification | None:
+        return self._classifications.get((normalize_statement_text(text), is_expense))
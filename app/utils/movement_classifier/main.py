@@ -1,6 +1,8 @@
-from datetime import datetime
+import asyncio
+from collections import defaultdict, deque
+from datetime import date, datetime
 from pathlib import Path
-from typing import Literal
+from typing import Callable, Literal, TypeVar
 from zoneinfo import ZoneInfo
 
 import yaml
@@ -16,11 +18,16 @@ from app.storage.incomes.base import IncomeStorageInterface
 from app.utils.categories import get_categories_str
 from app.utils.config import settings
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.movement_classifier.cache import (
+    STATEMENT_TEXT_KEY,
+    ClassificationCache,
+)
+from app.utils.movement_classifier.similarity import SimilarityClassifier
 
 EXPENSE_CATEGORIES_PATH = "expense_categories.yml"
 INCOME_CATEGORIES_PATH = "income_categories.yml"
 SPECIAL_INSTRUCTIONS_PATH = "category_instructions.txt"
-STATEMENT_TEXT_KEY = "statement_text"
 
 SYSTEM_PROMPT_PATH = Path(__file__).parent / "prompts/system.jinja2"
 USER_PROMPT_PATH = Path(__file__).parent / "prompts/user.jinja2"
@@ -30,6 +37,8 @@ USER_PROMPT_TEMPLATE = Template(USER_PROMPT_PATH.read_text())
 
 SPECIAL_INSTRUCTIONS = Path(SPECIAL_INSTRUCTIONS_PATH).read_text()
 
+MODEL = "gpt-4o-mini"
+
 
 class MovementClassification(BaseModel):
     movement_id: str
@@ -42,65 +51,200 @@ class ClassificationOutput(BaseModel):
     movements: list[MovementClassification]
 
 
-def is_matching_movement(
-    movement: Movement, expense_or_income: Expense | Income
-) -> bool:
-    return (expense_or_income.timestamp.date() == movement.min_date) and (
-        (round(expense_or_income.cost, 2) == round(-movement.amount, 2))
+# Date and amount in integer cents, plus the statement text for duplicates
+MatchKey = tuple[date, int]
+DuplicateKey = tuple[date, int, str]
+
+K = TypeVar("K", bound=tuple)
+T = TypeVar("T", Expense, Income)
+
+
+def _cents(amount: float) -> int:
+    return round(amount * 100)
+
+
+def match_key(expense_or_income: Expense | Income) -> MatchKey:
+    amount = (
+        expense_or_income.cost
         if isinstance(expense_or_income, Expense)
-        else (round(expense_or_income.value, 2) == round(movement.amount, 2))
+        else expense_or_income.value
     )
+    return expense_or_income.timestamp.date(), _cents(amount)
+
 
+def movement_match_key(movement: Movement, as_expense: bool) -> MatchKey:
+    """Key of the expense (a cost, hence the sign) or income the movement is"""
+    amount = -movement.amount if as_expense else movement.amount
+    return movement.min_date, _cents(amount)
 
-def is_duplicate_movement(
-    movement: Movement, expense_or_income: Expense | Income
-) -> bool:
+
+def duplicate_key(expense_or_income: Expense | Income) -> DuplicateKey:
     return (
-        (expense_or_income.timestamp.date() == movement.min_date)
-        and (
-            (round(expense_or_income.cost, 2) == round(-movement.amount, 2))
-            if isinstance(expense_or_income, Expense)
-            else (round(expense_or_income.value, 2) == round(movement.amount, 2))
-        )
-        and (expense_or_income.metadata is not None)
-        and (STATEMENT_TEXT_KEY in expense_or_income.metadata)
-        and (expense_or_income.metadata[STATEMENT_TEXT_KEY] == movement.description)
+        *match_key(expense_or_income),
+        (expense_or_income.metadata or {})[STATEMENT_TEXT_KEY],
     )
 
 
-async def classify_movements(
-    movements: list[Movement],
-    openai_client: AsyncOpenAI,
-) -> ClassificationOutput:
+def movement_duplicate_key(movement: Movement, as_expense: bool) -> DuplicateKey:
+    return *movement_match_key(movement, as_expense), movement.description
+
+
+def build_index(items: list[T], key: Callable[[T], K]) -> dict[K, deque[T]]:
+    """Items by key, each key keeping the order of the items"""
+    index: defaultdict[K, deque[T]] = defaultdict(deque)
+    for item in items:
+        index[key(item)].append(item)
+    return index
+
+
+def take_first(index: dict[K, deque[T]], key: K) -> T | None:
+    """Remove and return the first item with the key, if any is left"""
+    items = index.get(key)
+    return items.popleft() if items else None
+
+
+def _system_prompt() -> str:
     expense_categories: dict[str, dict | None] = yaml.safe_load(
         Path(EXPENSE_CATEGORIES_PATH).read_text()
     )
     income_categories: dict[str, dict | None] = yaml.safe_load(
         Path(INCOME_CATEGORIES_PATH).read_text()
     )
-    system_prompt = SYSTEM_PROMPT_TEMPLATE.render(
+    return SYSTEM_PROMPT_TEMPLATE.render(
         expense_categories=get_categories_str(expense_categories),
         income_categories=get_categories_str(income_categories),
         special_instructions=SPECIAL_INSTRUCTIONS,
         language=settings.DEFAULT_LANGUAGE,
     )
+
+
+async def _classify_chunk(
+    movements: list[Movement],
+    system_prompt: str,
+    openai_client: AsyncOpenAI,
+) -> list[MovementClassification]:
     user_prompt = USER_PROMPT_TEMPLATE.render(
         movements=movements,
     )
 
-    response = await openai_client.beta.chat.completions.parse(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        response_format=ClassificationOutput,
-    )
+    with metrics.timer("openai_request_seconds", model=MODEL):
+        response = await openai_client.beta.chat.completions.parse(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            response_format=ClassificationOutput,
+        )
+    if response.usage is not None:
+        metrics.inc("openai_completions_total", model=MODEL)
+        metrics.inc(
+            "openai_prompt_tokens_total",
+            response.usage.prompt_tokens,
+            model=MODEL,
+        )
+        metrics.inc(
+            "openai_completion_tokens_total",
+            response.usage.completion_tokens,
+            model=MODEL,
+        )
 
     parsed_response = response.choices[0].message.parsed
     if parsed_response is None:
         raise ValueError("No response from OpenAI")
-    return parsed_response
+    return parsed_response.movements
+
+
+async def classify_movements(
+    movements: list[Movement],
+    openai_client: AsyncOpenAI,
+    classifier: SimilarityClassifier | None = None,
+    min_confidence: float = settings.CLASSIFIER_MIN_CONFIDENCE,
+    chunk_size: int = settings.CLASSIFICATION_CHUNK_SIZE,
+    concurrency: int = settings.CLASSIFICATION_CONCURRENCY,
+    attempts: int = settings.CLASSIFICATION_ATTEMPTS,
+) -> ClassificationOutput:
+    """Classify the movements with the local classifier, and the rest with the
+    model in chunks of `chunk_size`, `concurrency` at once.
+
+    Only the movements the classifier predicts with less than `min_confidence`
+    go to the model. Movements the model leaves out, or whose chunk failed, are
+    sent again in new chunks, up to `attempts` times in total. The
+    classifications are returned in the order of the movements, whatever order
+    the chunks finish in. Model errors are only raised if the model could not
+    classify any movement.
+    """
+    classified: dict[str, MovementClassification] = {}
+    pending = movements
+    if classifier is not None:
+        pending = []
+        # Each prediction takes milliseconds, too long for the event loop
+        predictions = await asyncio.to_thread(
+            classifier.predict_many,
+            [(movement.description, movement.amount <= 0) for movement in movements],
+        )
+        for movement, prediction in zip(movements, predictions):
+            if prediction is None or prediction.confidence < min_confidence:
+                pending.append(movement)
+                continue
+            classified[movement.movement_id] = MovementClassification(
+                movement_id=movement.movement_id,
+                concept=prediction.concept,
+                category=prediction.category,
+                payment_method=prediction.payment_method,  # type: ignore
+            )
+        metrics.inc("movement_classifier_hits_total", len(classified))
+        metrics.inc("movement_classifier_escalations_total", len(pending))
+        logger.info(
+            f"Classified {len(classified)} movements locally, "
+            f"{len(pending)} left for the model"
+        )
+    locally_classified = len(classified)
+
+    system_prompt = _system_prompt()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def classify_chunk(chunk: list[Movement]) -> list[MovementClassification]:
+        async with semaphore:
+            return await _classify_chunk(chunk, system_prompt, openai_client)
+
+    error: BaseException | None = None
+    for attempt in range(attempts):
+        if not pending:
+            break
+        chunks = [
+            pending[i : i + chunk_size] for i in range(0, len(pending), chunk_size)
+        ]
+        results = await asyncio.gather(
+            *(classify_chunk(chunk) for chunk in chunks), return_exceptions=True
+        )
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to classify {len(chunk)} movements: {result}")
+                error = result
+                continue
+            chunk_ids = {movement.movement_id for movement in chunk}
+            for classification in result:
+                # Ids not asked for in the chunk are made up, and the first
+                # answer for an id wins
+                if classification.movement_id in chunk_ids:
+                    classified.setdefault(classification.movement_id, classification)
+        pending = [
+            movement for movement in pending if movement.movement_id not in classified
+        ]
+        if pending and attempt < attempts - 1:
+            logger.warning(f"Retrying the classification of {len(pending)} movements")
+            metrics.inc("movement_classification_retries_total", len(pending))
+
+    if error is not None and len(classified) == locally_classified:
+        raise error
+    return ClassificationOutput(
+        movements=[
+            classified[movement.movement_id]
+            for movement in movements
+            if movement.movement_id in classified
+        ]
+    )
 
 
 async def process_movements(
@@ -109,13 +253,27 @@ async def process_movements(
     expense_storage: ExpenseStorageInterface,
     income_storage: IncomeStorageInterface,
     openai_client: AsyncOpenAI,
+    cache: ClassificationCache | None = None,
+    classifier: SimilarityClassifier | None = None,
 ) -> list[Expense | Income]:
+    """Add the new movements of a statement as expenses and incomes.
+
+    Movements matching expenses or incomes entered by hand are linked to them,
+    those already imported are skipped, and the rest are classified: from
+    `cache` when their statement text was classified before, then by the local
+    `classifier` when it is confident, and by the model otherwise. Without a
+    cache, one is built for this import.
+    """
     logger.info(f"Processing {len(movements)} movements")
-    expenses = await expense_storage.get_expenses(force_reload=True)
-    logger.info(f"Found {len(expenses)} expenses")
-    incomes = await income_storage.get_incomes(force_reload=True)
-    logger.info(f"Found {len(incomes)} incomes")
     min_movement_date = min(movement.min_date for movement in movements)
+    expenses = await expense_storage.get_expenses(
+        force_reload=True, since=min_movement_date
+    )
+    logger.info(f"Found {len(expenses)} expenses since {min_movement_date}")
+    incomes = await income_storage.get_incomes(
+        force_reload=True, since=min_movement_date
+    )
+    logger.info(f"Found {len(incomes)} incomes since {min_movement_date}")
 
     unmatched_expenses = [
         expense
@@ -123,7 +281,6 @@ async def process_movements(
         if (
             (expense.input_method in ("bot", "manual"))
             and (STATEMENT_TEXT_KEY not in (expense.metadata or {}))
-            and (expense.timestamp.date() >= min_movement_date)
         )
     ]
     unmatched_incomes = [
@@ -131,73 +288,76 @@ async def process_movements(
         for income in incomes
         if (income.input_method in ("bot", "manual"))
         and (STATEMENT_TEXT_KEY not in (income.metadata or {}))
-        and (income.timestamp.date() >= min_movement_date)
     ]
 
     unmatched_movements: list[Movement] = []
-
-    # Match the movements with the expenses based on the date and amount
-    for i, movement in enumerate(movements):
-        for j, unmatched_expense in enumerate(unmatched_expenses):
-            if is_matching_movement(movement, unmatched_expense):
-                # Match the movement with the expense, adding the STATEMENT_TEXT_KEY to the expense metadata and removing the expense from the list to match
-                metadata = unmatched_expense.metadata or {}
-                new_metadata = {**metadata, STATEMENT_TEXT_KEY: movement.description}
-                new_expense = unmatched_expense.model_copy(
-                    update={"metadata": new_metadata}
-                )
-                await expense_storage.update_expense(new_expense)
-                unmatched_expenses.pop(j)
-                break  # Go to the next movement
-        else:
-            for j, unmatched_income in enumerate(unmatched_incomes):
-                if is_matching_movement(movement, unmatched_income):
-                    new_metadata = {
-                        **(unmatched_income.metadata or {}),
-                        STATEMENT_TEXT_KEY: movement.description,
-                    }
-                    new_income = unmatched_income.model_copy(
-                        update={"metadata": new_metadata}
-                    )
-                    await income_storage.update_income(new_income)
-                    unmatched_incomes.pop(j)
-                    break
-            else:
-                unmatched_movements.append(movement)
+    matched_expenses: list[Expense] = []
+    matched_incomes: list[Income] = []
+
+    # Match the movements with the expenses based on the date and amount. Each
+    # movement takes the first expense left with its key, then the first income
+    expense_index = build_index(unmatched_expenses, match_key)
+    income_index = build_index(unmatched_incomes, match_key)
+    for movement in movements:
+        unmatched_expense = take_first(
+            expense_index, movement_match_key(movement, as_expense=True)
+        )
+        if unmatched_expense is not None:
+            # Match the movement with the expense, adding the STATEMENT_TEXT_KEY to the expense metadata
+            metadata = unmatched_expense.metadata or {}
+            new_metadata = {**metadata, STATEMENT_TEXT_KEY: movement.description}
+            new_expense = unmatched_expense.model_copy(
+                update={"metadata": new_metadata}
+            )
+            matched_expenses.append(new_expense)
+            continue
+        unmatched_income = take_first(
+            income_index, movement_match_key(movement, as_expense=False)
+        )
+        if unmatched_income is not None:
+            new_metadata = {
+                **(unmatched_income.metadata or {}),
+                STATEMENT_TEXT_KEY: movement.description,
+            }
+            new_income = unmatched_income.model_copy(update={"metadata": new_metadata})
+            matched_incomes.append(new_income)
+            continue
+        unmatched_movements.append(movement)
+
+    # Write all the matches back in one batch per storage
+    if matched_expenses:
+        await expense_storage.update_expenses(matched_expenses)
+    if matched_incomes:
+        await income_storage.update_incomes(matched_incomes)
 
     logger.info(
         f"Matched {len(movements) - len(unmatched_movements)} movements with previously inputed expenses"
     )
 
     existing_expenses = [
-        e
-        for e in expenses
-        if (STATEMENT_TEXT_KEY in (e.metadata or {}))
-        and (e.timestamp.date() >= min_movement_date)
-    ]
-    existing_incomes = [
-        i
-        for i in incomes
-        if (STATEMENT_TEXT_KEY in (i.metadata or {}))
-        and (i.timestamp.date() >= min_movement_date)
+        e for e in expenses if STATEMENT_TEXT_KEY in (e.metadata or {})
     ]
+    existing_incomes = [i for i in incomes if STATEMENT_TEXT_KEY in (i.metadata or {})]
     new_movements: list[Movement] = []
 
-    # Match the movements with the existing ETL expenses based on the date and amount
-    for i, movement in enumerate(unmatched_movements):
-        for j, existing_etl_expense in enumerate(existing_expenses):
-            if is_duplicate_movement(movement, existing_etl_expense):
-                # We no longer need to match this movement with an expense, so we can skip it in the next loop
-                existing_expenses.pop(j)
-                break
-        else:
-            for j, existing_etl_income in enumerate(existing_incomes):
-                if is_duplicate_movement(movement, existing_etl_income):
-                    # We no longer need to match this movement with an income, so we can skip it in the next loop
-                    existing_incomes.pop(j)
-                    break
-            else:
-                new_movements.append(movement)
+    # Match the movements with the existing ETL expenses based on the date,
+    # amount and statement text. Each one can only be the duplicate of one movement
+    existing_expense_index = build_index(existing_expenses, duplicate_key)
+    existing_income_index = build_index(existing_incomes, duplicate_key)
+    for movement in unmatched_movements:
+        if (
+            take_first(
+                existing_expense_index,
+                movement_duplicate_key(movement, as_expense=True),
+            )
+            is None
+            and take_first(
+                existing_income_index,
+                movement_duplicate_key(movement, as_expense=False),
+            )
+            is None
+        ):
+            new_movements.append(movement)
 
     logger.info(f"There are {len(new_movements)} new movements to be processed")
 
@@ -206,16 +366,41 @@ async def process_movements(
         logger.info("No new movements to process")
         return []
 
-    logger.info("Classifying new movements")
-    classifications = await classify_movements(new_movements, openai_client)
-    for classification in classifications.movements:
-        if classification.category[0] == "other":
-            logger.warning(f"Movement {classification.movement_id} classified as other")
+    if cache is None:
+        cache = ClassificationCache(expense_storage, income_storage)
+    await cache.sync()
+    classifications_map: dict[str, MovementClassification] = {}
+    cache_misses: list[Movement] = []
+    for movement in new_movements:
+        cached = cache.get(movement)
+        if cached is None:
+            cache_misses.append(movement)
+            continue
+        concept, category, payment_method = cached
+        classifications_map[movement.movement_id] = MovementClassification(
+            movement_id=movement.movement_id,
+            concept=concept,
+            category=list(category),
+            payment_method=payment_method,  # type: ignore
+        )
+    metrics.inc("classification_cache_hits_total", len(classifications_map))
+    metrics.inc("classification_cache_misses_total", len(cache_misses))
+    logger.info(
+        f"Classified {len(classifications_map)} movements from the cache, "
+        f"{len(cache_misses)} left for the model"
+    )
 
-    classifications_map = {
-        classification.movement_id: classification
-        for classification in classifications.movements
-    }
+    if cache_misses:
+        logger.info("Classifying new movements")
+        classifications = await classify_movements(
+            cache_misses, openai_client, classifier
+        )
+        for classification in classifications.movements:
+            if classification.category[0] == "other":
+                logger.warning(
+                    f"Movement {classification.movement_id} classified as other"
+                )
+            classifications_map[classification.movement_id] = classification
 
     new_expenses_or_incomes: list[Expense | Income] = []
     expenses_to_add: list[Expense] = []
@@ -0,0 +1,322 @@
+import asyncio
+import io
+import json
+from collections import Counter
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+from redis.asyncio import Redis
+
+from app.models.expense import Expense
+from app.models.income import Income
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.movement_classifier.cache import (
+    classified_statement_text,
+    normalize_statement_text,
+)
+
+NGRAM_SIZES = (3, 4)
+
+# Where the worker publishes the trained classifier for the app
+MODEL_KEY = "movement_classifier:model"
+VERSION_KEY = "movement_classifier:version"
+
+
+def char_ngrams(text: str) -> Counter[str]:
+    """Character n-grams of the normalized statement text, with the words
+    padded so their starts and ends count as n-grams of their own"""
+    text = f" {normalize_statement_text(text)} "
+    return Counter(
+        text[i : i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1)
+    )
+
+
+@dataclass(frozen=True)
+class Example:
+    text: str
+    is_expense: bool
+    concept: str
+    category: tuple[str, ...]
+    payment_method: str
+
+
+def examples_from(items: Sequence[Expense | Income]) -> dict[str, Example]:
+    """Training examples by expense or income id"""
+    examples: dict[str, Example] = {}
+    for item in items:
+        text = classified_statement_text(item)
+        if text is None:
+            continue
+        is_expense = isinstance(item, Expense)
+        item_id = item.expense_id if is_expense else item.income_id  # type: ignore
+        examples[item_id] = Example(
+            text=text,
+            is_expense=is_expense,
+            concept=item.concept,
+            category=tuple(item.category),
+            payment_method=item.payment_method,  # type: ignore
+        )
+    return examples
+
+
+@dataclass
+class Prediction:
+    concept: str
+    category: list[str]
+    payment_method: str
+    confidence: float
+
+
+class SimilarityClassifier:
+    """k nearest neighbours over char n-gram TF-IDF vectors of statement texts.
+
+    Near-duplicate lines, e.g. the same merchant with another branch code, get
+    the category of the most similar past movements of the same sign. The
+    confidence is the share of the neighbours' similarity that agrees on the
+    category, times the similarity of the closest one among them.
+
+    The vectors are kept as an inverted index, the weighted documents of each
+    n-gram, so a prediction only touches the documents sharing n-grams with it.
+    """
+
+    def __init__(
+        self,
+        vocabulary: dict[str, int],
+        idf: np.ndarray,
+        indptr: np.ndarray,
+        documents: np.ndarray,
+        weights: np.ndarray,
+        is_expense: np.ndarray,
+        labels: list[tuple[str, tuple[str, ...], str]],
+        document_labels: np.ndarray,
+        neighbours: int = settings.CLASSIFIER_NEIGHBOURS,
+    ):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        # Documents and weights of n-gram i are in indptr[i]:indptr[i + 1]
+        self.indptr = indptr
+        self.documents = documents
+        self.weights = weights
+        self.is_expense = is_expense
+        # Concept, category and payment method
+        self.labels = labels
+        self.document_labels = document_labels
+        self.neighbours = neighbours
+
+    def __len__(self) -> int:
+        return len(self.is_expense)
+
+    @classmethod
+    def fit(
+        cls,
+        examples: Sequence[Example],
+        ngrams: Sequence[Counter[str]] | None = None,
+    ) -> "SimilarityClassifier":
+        """Train on the examples, with their n-grams if already computed"""
+        if ngrams is None:
+            ngrams = [char_ngrams(example.text) for example in examples]
+        vocabulary: dict[str, int] = {}
+        rows: list[int] = []
+        columns: list[int] = []
+        counts: list[int] = []
+        for document, document_ngrams in enumerate(ngrams):
+            for ngram, count in document_ngrams.items():
+                rows.append(document)
+                columns.append(vocabulary.setdefault(ngram, len(vocabulary)))
+                counts.append(count)
+        row = np.array(rows, dtype=np.int32)
+        column = np.array(columns, dtype=np.int32)
+        size = len(examples)
+
+        frequencies = np.bincount(column, minlength=len(vocabulary))
+        idf = np.log((1 + size) / (1 + frequencies)) + 1
+        # Sublinear term frequency, then every document scaled to unit length
+        weight = (1 + np.log(np.array(counts, dtype=np.float64))) * idf[column]
+        norms = np.sqrt(np.bincount(row, weights=weight**2, minlength=size))
+        weight /= norms[row]
+
+        order = np.argsort(column, kind="stable")
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(frequencies, out=indptr[1:])
+
+        labels: dict[tuple[str, tuple[str, ...], str], int] = {}
+        document_labels = np.array(
+            [
+                labels.setdefault(
+                    (example.concept, example.category, example.payment_method),
+                    len(labels),
+                )
+                for example in examples
+            ],
+            dtype=np.int32,
+        )
+        return cls(
+            vocabulary=vocabulary,
+            idf=idf.astype(np.float32),
+            indptr=indptr,
+            documents=row[order],
+            weights=weight[order].astype(np.float32),
+            is_expense=np.array(
+                [example.is_expense for example in examples], dtype=bool
+            ),
+            labels=list(labels),
+            document_labels=document_labels,
+        )
+
+    def _similarities(self, text: str) -> np.ndarray | None:
+        query = [
+            (self.vocabulary[ngram], count)
+            for ngram, count in char_ngrams(text).items()
+            if ngram in self.vocabulary
+        ]
+        if not query:
+            return None
+        ids = np.array([ngram_id for ngram_id, _ in query])
+        weights = (
+            1 + np.log(np.array([count for _, count in query], dtype=np.float32))
+        ) * self.idf[ids]
+        weights /= np.linalg.norm(weights)
+        similarities = np.zeros(len(self), dtype=np.float32)
+        for ngram_id, weight in zip(ids, weights):
+            start, end = self.indptr[ngram_id], self.indptr[ngram_id + 1]
+            similarities[self.documents[start:end]] += weight * self.weights[start:end]
+        return similarities
+
+    def predict(self, text: str, is_expense: bool) -> Prediction | None:
+        """Classification of a statement line, None if nothing is similar"""
+        if not len(self):
+            return None
+        similarities = self._similarities(text)
+        if similarities is None:
+            return None
+        similarities[self.is_expense != is_expense] = 0
+        k = min(self.neighbours, len(self))
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+        nearest = nearest[similarities[nearest] > 0]
+        if not len(nearest):
+            return None
+        nearest = nearest[np.argsort(-similarities[nearest], kind="stable")]
+
+        votes: Counter[tuple[str, ...]] = Counter()
+        closest: dict[tuple[str, ...], int] = {}
+        for document in nearest:
+            label = self.labels[self.document_labels[document]]
+            votes[label[1]] += float(similarities[document])
+            # The neighbours are sorted, so the first one is the closest
+            closest.setdefault(label[1], document)
+        category, score = votes.most_common(1)[0]
+        document = closest[category]
+        concept, _, payment_method = self.labels[self.document_labels[document]]
+        return Prediction(
+            concept=concept,
+            category=list(category),
+            payment_method=payment_method,
+            confidence=score / votes.total() * float(similarities[document]),
+        )
+
+    def predict_many(
+        self, lines: Sequence[tuple[str, bool]]
+    ) -> list[Prediction | None]:
+        """Classifications of (statement text, is expense) lines, to be run in
+        a thread for statements with many lines"""
+        return [self.predict(text, is_expense) for text, is_expense in lines]
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        metadata = json.dumps({"labels": self.labels}).encode()
+        np.savez(
+            buffer,
+            vocabulary=np.array(list(self.vocabulary)),
+            idf=self.idf,
+            indptr=self.indptr,
+            documents=self.documents,
+            weights=self.weights,
+            is_expense=self.is_expense,
+            document_labels=self.document_labels,
+            metadata=np.frombuffer(metadata, dtype=np.uint8),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SimilarityClassifier":
+        arrays = np.load(io.BytesIO(data), allow_pickle=False)
+        metadata = json.loads(arrays["metadata"].tobytes())
+        return cls(
+            vocabulary={
+                ngram: i for i, ngram in enumerate(arrays["vocabulary"].tolist())
+            },
+            idf=arrays["idf"],
+            indptr=arrays["indptr"],
+            documents=arrays["documents"],
+            weights=arrays["weights"],
+            is_expense=arrays["is_expense"],
+            labels=[
+                (concept, tuple(category), payment_method)
+                for concept, category, payment_method in metadata["labels"]
+            ],
+            document_labels=arrays["document_labels"],
+        )
+
+
+class ClassifierTrainer:
+    """Keeps the training examples and their n-grams between trainings, so
+    only the examples added or changed since the last one are tokenized"""
+
+    def __init__(self) -> None:
+        self._examples: dict[str, tuple[Example, Counter[str]]] = {}
+
+    def update(self, examples: dict[str, Example]) -> bool:
+        """Replace the examples, True if any was added, changed or removed"""
+        removed = self._examples.keys() - examples.keys()
+        for item_id in removed:
+            del self._examples[item_id]
+        changed = bool(removed)
+        for item_id, example in examples.items():
+            current = self._examples.get(item_id)
+            if current is None or current[0] != example:
+                self._examples[item_id] = (example, char_ngrams(example.text))
+                changed = True
+        return changed
+
+    def fit(self) -> SimilarityClassifier:
+        examples = list(self._examples.values())
+        return SimilarityClassifier.fit(
+            [example for example, _ in examples], [ngrams for _, ngrams in examples]
+        )
+
+
+async def publish_classifier(redis: Redis, classifier: SimilarityClassifier) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(MODEL_KEY, classifier.to_bytes())
+        pipe.incr(VERSION_KEY)
+        await pipe.execute()
+
+
+class PublishedClassifier:
+    """The latest classifier published by the worker, loaded again only when
+    a new one is published"""
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self._version: bytes | None = None
+        self._classifier: SimilarityClassifier | None = None
+
+    async def get(self) -> SimilarityClassifier | None:
+        try:
+            version = await self.redis.get(VERSION_KEY)
+            if version is not None and version != self._version:
+                data = await self.redis.get(MODEL_KEY)
+                if data is not None:
+                    self._classifier = await asyncio.to_thread(
+                        SimilarityClassifier.from_bytes, data
+                    )
+                    self._version = version
+                    logger.info(
+                        f"Loaded movement classifier trained on {len(self._classifier)} movements"
+                    )
+        except Exception as e:
+            # Classification falls back to the model alone
+            logger.warning(f"Failed to load the movement classifier: {e}")
+        return self._classifier
@@ -1,10 +1,53 @@
+import asyncio
 from typing import Any
 
 from arq import cron
 from arq.connections import RedisSettings
 
+from app.storage.factory import create_expense_storage, create_income_storage
 from app.utils.config import settings
 from app.utils.logger import logger
+from app.utils.movement_classifier.similarity import (
+    ClassifierTrainer,
+    examples_from,
+    publish_classifier,
+)
+
+
+async def startup(ctx: dict[str, Any]):
+    ctx["expense_storage"] = create_expense_storage()
+    ctx["income_storage"] = create_income_storage()
+    await ctx["expense_storage"].start()
+    await ctx["income_storage"].start()
+    ctx["classifier_trainer"] = ClassifierTrainer()
+
+
+async def shutdown(ctx: dict[str, Any]):
+    await ctx["expense_storage"].close()
+    await ctx["income_storage"].close()
+
+
+async def train_movement_classifier(ctx: dict[str, Any]):
+    """Train the movement classifier on the expenses and incomes imported or
+    recategorized since the last training, and publish it for the app"""
+    trainer: ClassifierTrainer = ctx["classifier_trainer"]
+    items = [
+        *await ctx["expense_storage"].get_expenses(force_reload=True),
+        *await ctx["income_storage"].get_incomes(force_reload=True),
+    ]
+    if not trainer.update(examples_from(items)):
+        logger.info("Movement classifier is up to date")
+        return
+    classifier = await asyncio.to_thread(trainer.fit)
+    await publish_classifier(ctx["redis"], classifier)
+    logger.info(f"Published movement classifier trained on {len(classifier)} movements")
+
+
+async def reload_storages(ctx: dict[str, Any]):
+    """Reload the expenses and incomes from scratch. The syncs of the
+    trainings only check older rows for edits now and then"""
+    await ctx["expense_storage"].reload_cache()
+    await ctx["income_storage"].reload_cache()
 
 
 async def sample_job(ctx: dict[str, Any]):
@@ -34,6 +77,24 @@ async def sample_job(ctx: dict[str, Any]):
 
 class WorkerSettings:
     redis_settings = RedisSettings(host=settings.REDIS_HOST)
-    functions = [sample_job]
+    functions = [sample_job, train_movement_classifier, reload_storages]
+    on_startup = startup
+    on_shutdown = shutdown
     # Configure job schedules
-    cron_jobs = [cron(name="sample_job", coroutine=sample_job, hour=0, second=0)]
+    cron_jobs = [
+        cron(name="sample_job", coroutine=sample_job, hour=0, second=0),
+        cron(
+            name="reload_storages",
+            coroutine=reload_storages,
+            hour=4,
+            minute=30,
+            second=0,
+        ),
+        cron(
+            name="train_movement_classifier",
+            coroutine=train_movement_classifier,
+            minute=set(range(0, 60, settings.CLASSIFIER_TRAIN_INTERVAL)),
+            second=0,
+            run_at_startup=True,
+        ),
+    ]
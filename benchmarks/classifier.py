@@ -0,0 +1,143 @@
+"""Offline accuracy and latency of the movement classifier on held-out history.
+
+    python -m benchmarks.classifier                    # synthetic history
+    python -m benchmarks.classifier --size 50000 --holdout 0.1
+    python -m benchmarks.classifier --storage          # the configured storages
+
+The classifier is trained on the older part of the history and classifies the
+newest `holdout` share, as the next statements would be. As in
+process_movements, lines the classification cache already knows are left out,
+the classifier only sees the cache misses. For each confidence threshold it
+reports the share of those classified locally (the rest go to the model) and
+how many of them got the right category.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import Any
+
+from benchmarks.run import ROOT, _percentile, _prepare_workdir
+
+THRESHOLDS = [0.0, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+async def load_storage_history() -> list[Any]:
+    from app.storage.factory import create_expense_storage, create_income_storage
+
+    expense_storage = create_expense_storage()
+    income_storage = create_income_storage()
+    await expense_storage.start()
+    await income_storage.start()
+    try:
+        items = [
+            *await expense_storage.get_expenses(),
+            *await income_storage.get_incomes(),
+        ]
+    finally:
+        await expense_storage.close()
+        await income_storage.close()
+    return sorted(items, key=lambda item: item.timestamp)
+
+
+def evaluate(items: list[Any], holdout: float) -> None:
+    from app.utils.movement_classifier.cache import (
+        ClassificationCache,
+        classified_statement_text,
+    )
+    from app.utils.movement_classifier.similarity import (
+        ClassifierTrainer,
+        examples_from,
+    )
+
+    items = [item for item in items if classified_statement_text(item) is not None]
+    split = int(len(items) * (1 - holdout))
+    train_items = items[:split]
+    train = examples_from(train_items)
+    cache = ClassificationCache(None, None)  # type: ignore
+    cache.rebuild(train_items)
+    held_out = list(examples_from(items[split:]).values())
+    test = [
+        example
+        for example in held_out
+        if cache.lookup(example.text, example.is_expense) is None
+    ]
+    print(
+        f"{len(train)} movements to train on, {len(held_out)} held out, of which "
+        f"{len(held_out) - len(test)} hit the cache and {len(test)} are left"
+    )
+
+    trainer = ClassifierTrainer()
+    start = time.perf_counter()
+    trainer.update(train)
+    tokenized = time.perf_counter()
+    classifier = trainer.fit()
+    fitted = time.perf_counter()
+    size = len(classifier.to_bytes())
+    print(
+        f"Tokenized in {(tokenized - start) * 1000:.0f}ms, fitted in "
+        f"{(fitted - tokenized) * 1000:.0f}ms, {size / 1e6:.1f}MB serialized"
+    )
+    if not test:
+        return
+
+    predictions = []
+    latencies = []
+    for example in test:
+        start = time.perf_counter()
+        predictions.append(classifier.predict(example.text, example.is_expense))
+        latencies.append(time.perf_counter() - start)
+    print(
+        f"Prediction latency: p50 {_percentile(latencies, 0.5) * 1e6:.0f}us, "
+        f"p99 {_percentile(latencies, 0.99) * 1e6:.0f}us\n"
+    )
+
+    print(f"{'threshold':>10}{'local':>10}{'accuracy':>10}{'to model':>10}")
+    for threshold in THRESHOLDS:
+        local = [
+            (prediction, example)
+            for prediction, example in zip(predictions, test)
+            if prediction is not None and prediction.confidence >= threshold
+        ]
+        correct = sum(
+            tuple(prediction.category) == example.category
+            for prediction, example in local
+        )
+        print(
+            f"{threshold:>10.1f}{len(local) / len(test):>10.1%}"
+            f"{correct / len(local) if local else 0:>10.1%}"
+            f"{len(test) - len(local):>10}"
+        )
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.storage:
+        # The real settings and credentials, from the repo root
+        sys.path.insert(0, str(ROOT))
+        items = asyncio.run(load_storage_history())
+        logging.getLogger("expense-tracker-bot").setLevel(logging.WARNING)
+        evaluate(items, args.holdout)
+        return
+    workdir = _prepare_workdir()
+    try:
+        from benchmarks.synthetic import make_statement_history
+
+        logging.getLogger("expense-tracker-bot").setLevel(logging.WARNING)
+        evaluate(make_statement_history(args.size), args.holdout)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument(
+        "--storage", action="store_true", help="Use the history in the storages"
+    )
+    main(parser.parse_args())
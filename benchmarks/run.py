@@ -0,0 +1,389 @@
+"""Benchmarks of the bot's hot paths on synthetic data.
+
+    python -m benchmarks.run                          # all cases and sizes
+    python -m benchmarks.run --sizes 1000 --cases reload_cache
+    python -m benchmarks.run --save-baseline          # store results as baselines
+    python -m benchmarks.run --check                  # exit 1 on regressions
+
+Google Sheets is replaced by FakeWorksheet and OpenAI by a stub. Everything runs
+in a temporary working directory, so the journal, logs and chat history of the
+repo are not touched. Results are compared with benchmarks/baselines.json.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+SIZES = [1_000, 10_000, 100_000]
+STATEMENT_SIZE = 200
+CHAT_ID = 0
+REGRESSION_TOLERANCE = 0.25  # p50 slowdown over the baseline flagged as regression
+
+# The settings are required but nothing connects to Telegram, Google or OpenAI
+DUMMY_ENV = {
+    "TELEGRAM_BOT_TOKEN_PROD": "benchmark",
+    "TELEGRAM_BOT_TOKEN_DEV": "benchmark",
+    "TELEGRAM_CHAT_ID": "0",
+    "GOOGLE_SHEETS_CREDENTIALS": "benchmark.json",
+    "EXPENSES_SHEET_ID": "benchmark",
+    "INCOMES_SHEET_ID": "benchmark",
+    "OPENAI_API_KEY": "benchmark",
+    "DEFAULT_CURRENCY": "€",
+    "DEFAULT_LANGUAGE": "english",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "REDIS_DB": "0",
+}
+
+
+@dataclass
+class Case:
+    name: str
+    # Untimed, builds the state passed to run
+    setup: Callable[[int], Awaitable[Any]]
+    # Timed, returns the number of items processed
+    run: Callable[[Any], Awaitable[int]]
+    repeat: int
+    # Build a new state for every run, for cases that modify it
+    fresh_state: bool = False
+    teardown: Callable[[Any], Awaitable[None]] | None = None
+
+
+@dataclass
+class Result:
+    case: str
+    size: int
+    p50_ms: float
+    p99_ms: float
+    throughput: float  # items per second at p50
+
+
+def _percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(p * len(ordered)) - 1, 0)]
+
+
+def _prepare_workdir() -> Path:
+    """Move to a scratch directory with the files the app reads at import time"""
+    workdir = Path(tempfile.mkdtemp(prefix="expense-bench-"))
+    for name in ("expense_categories.yml", "income_categories.yml"):
+        shutil.copy(ROOT / name, workdir / name)
+    instructions = ROOT / "category_instructions.txt"
+    (workdir / instructions.name).write_text(
+        instructions.read_text() if instructions.exists() else ""
+    )
+    for key, value in DUMMY_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ["SHEETS_JOURNAL_DIR"] = str(workdir / "journal")
+    os.chdir(workdir)
+    sys.path.insert(0, str(ROOT))
+    return workdir
+
+
+def _build_cases() -> list[Case]:
+    # Imported here, once the working directory and settings are in place
+    from gspread.utils import numericise_all, to_records
+
+    from app.agent.service import AgentService
+    from app.agent.tools.base import ResponseContext
+    from app.agent.tools.query_expenses.tool import QueryExpenses
+    from app.storage.chat.json_chat import JsonChatStorage
+    from app.storage.chat.jsonl_chat import JsonlChatStorage
+    from app.storage.expenses.google_sheets import GSpreadExpenseStorage
+    from app.storage.fake_sheets import FakeWorksheet
+    from app.storage.incomes.google_sheets import GSpreadIncomeStorage
+    from app.utils.movement_classifier.cache import ClassificationCache
+    from app.utils.movement_classifier.main import process_movements
+    from benchmarks.stubs import StubOpenAI
+    from benchmarks.synthetic import make_expenses, make_incomes, make_movements
+
+    ledgers: dict[int, tuple[list, list]] = {}
+
+    def ledger(size: int) -> tuple[list, list]:
+        if size not in ledgers:
+            ledgers[size] = (make_expenses(size), make_incomes(size // 10))
+        return ledgers[size]
+
+    def sheet(storage_class: type, items: list) -> FakeWorksheet:
+        encoder = storage_class(worksheet=FakeWorksheet())
+        header = list(encoder.MODEL.model_fields)
+        rows = [encoder._item_to_row(item) for item in items]
+        # Amounts as a number formatted column shows them, e.g. "1,234.50"
+        amount = header.index(encoder.AMOUNT_FIELD)
+        for row in rows:
+            row[amount] = f"{row[amount]:,.2f}"
+        return FakeWorksheet([header] + rows)
+
+    async def started(storage_class: type, items: list) -> Any:
+        storage = storage_class(worksheet=sheet(storage_class, items))
+        await storage.start()
+        return storage
+
+    # _record_to_item
+    async def setup_records(size: int) -> Any:
+        worksheet = sheet(GSpreadExpenseStorage, ledger(size)[0])
+        storage = GSpreadExpenseStorage(worksheet=worksheet)
+        records = to_records(
+            worksheet.rows[0], [numericise_all(row) for row in worksheet.rows[1:]]
+        )
+        return storage, records
+
+    async def run_records(state: Any) -> int:
+        storage, records = state
+        for record in records:
+            storage._record_to_item(record)
+        return len(records)
+
+    # Bulk decoding of sheet rows, used by reload_cache and sync_cache
+    async def setup_decode(size: int) -> Any:
+        worksheet = sheet(GSpreadExpenseStorage, ledger(size)[0])
+        storage = GSpreadExpenseStorage(worksheet=worksheet)
+        storage._header = worksheet.rows[0]
+        return storage, worksheet.rows[1:]
+
+    async def run_decode(state: Any) -> int:
+        storage, rows = state
+        return len(storage._rows_to_items(rows)[0])
+
+    # reload_cache
+    async def setup_reload(size: int) -> Any:
+        return GSpreadExpenseStorage(
+            worksheet=sheet(GSpreadExpenseStorage, ledger(size)[0])
+        )
+
+    async def run_reload(storage: Any) -> int:
+        await storage.reload_cache()
+        return len(await storage.get_expenses())
+
+    # QueryExpenses.call
+    async def setup_query(size: int) -> Any:
+        storage = await started(GSpreadExpenseStorage, ledger(size)[0])
+        tool = QueryExpenses(
+            sql="SELECT category, SUM(cost) AS total, COUNT(*) AS n FROM expenses "
+            "WHERE timestamp >= '2024-06-01' GROUP BY category ORDER BY total DESC"
+        )
+        return tool, ResponseContext(storage=storage)
+
+    async def run_query(state: Any) -> int:
+        tool, context = state
+        await tool.call(context)
+        return 1
+
+    async def setup_select_all(size: int) -> Any:
+        storage = await started(GSpreadExpenseStorage, ledger(size)[0])
+        tool = QueryExpenses(sql="SELECT * FROM expenses ORDER BY timestamp DESC")
+        return tool, ResponseContext(storage=storage)
+
+    # process_movements
+    async def setup_movements(size: int) -> Any:
+        expenses, incomes = ledger(size)
+        expense_storage = await started(GSpreadExpenseStorage, expenses)
+        income_storage = await started(GSpreadIncomeStorage, incomes)
+        # Warm, like the cache of a running bot
+        cache = ClassificationCache(expense_storage, income_storage)
+        await cache.sync()
+        return (
+            make_movements(expenses, incomes, STATEMENT_SIZE),
+            expense_storage,
+            income_storage,
+            cache,
+        )
+
+    async def run_movements(state: Any) -> int:
+        movements, expense_storage, income_storage, cache = state
+        await process_movements(
+            movements,
+            "alice",
+            expense_storage,
+            income_storage,
+            StubOpenAI(),  # type: ignore
+            cache,
+        )
+        return len(movements)
+
+    async def teardown_movements(state: Any) -> None:
+        _, expense_storage, income_storage, _ = state
+        await expense_storage.close()
+        await income_storage.close()
+
+    # AgentService._get_system_message and _get_context_message
+    async def setup_system_message(size: int) -> Any:
+        storage = await started(GSpreadExpenseStorage, ledger(size)[0])
+        service = AgentService(
+            StubOpenAI(), storage, JsonChatStorage("chat_system.json")
+        )  # type: ignore
+        return service, ResponseContext(storage=storage)
+
+    async def run_system_message(state: Any) -> int:
+        service, _ = state
+        service._get_system_message()
+        await service._get_context_message()
+        return 1
+
+    # JsonChatStorage.add_message, on a history of size // 10 messages
+    async def setup_chat(size: int) -> Any:
+        path = Path(f"chat_{size}_{CHAT_ID}.json")
+        path.write_text(
+            json.dumps(
+                [
+                    {"role": "user", "content": f"{i}.5 en Mercadona"}
+                    for i in range(size // 10)
+                ]
+            )
+        )
+        return JsonChatStorage(f"chat_{size}.json")
+
+    async def run_chat(storage: Any) -> int:
+        await storage.add_message(
+            CHAT_ID, {"role": "user", "content": "12,30 en Mercadona"}
+        )
+        return 1
+
+    # JsonlChatStorage.add_message, on a log of size // 10 messages
+    async def setup_jsonl_chat(size: int) -> Any:
+        path = Path(f"chats_{size}") / f"{CHAT_ID}.jsonl"
+        path.parent.mkdir()
+        path.write_text(
+            "".join(
+                json.dumps({"role": "user", "content": f"{i}.5 en Mercadona"}) + "\n"
+                for i in range(size // 10)
+            )
+        )
+        return JsonlChatStorage(str(path.parent), legacy_path=None)
+
+    async def teardown_chat(storage: Any) -> None:
+        await storage.close()
+
+    return [
+        Case("record_to_item", setup_records, run_records, repeat=5),
+        Case("decode_rows", setup_decode, run_decode, repeat=5),
+        Case("reload_cache", setup_reload, run_reload, repeat=5),
+        Case("query_expenses", setup_query, run_query, repeat=30),
+        Case("query_select_all", setup_select_all, run_query, repeat=30),
+        Case(
+            "process_movements",
+            setup_movements,
+            run_movements,
+            repeat=5,
+            fresh_state=True,
+            teardown=teardown_movements,
+        ),
+        Case("system_message", setup_system_message, run_system_message, repeat=30),
+        Case("chat_add_message", setup_chat, run_chat, repeat=30),
+        Case(
+            "jsonl_add_message",
+            setup_jsonl_chat,
+            run_chat,
+            repeat=30,
+            teardown=teardown_chat,
+        ),
+    ]
+
+
+async def measure(case: Case, size: int) -> Result:
+    samples: list[float] = []
+    items = 0
+    state = None
+    for i in range(case.repeat):
+        if state is None or case.fresh_state:
+            if state is not None and case.teardown is not None:
+                await case.teardown(state)
+            state = await case.setup(size)
+        # Start every sample from a clean heap, so collections of garbage left
+        # by the setup or previous samples do not land in the timings
+        gc.collect()
+        start = time.perf_counter()
+        items = await case.run(state)
+        samples.append(time.perf_counter() - start)
+    if state is not None and case.teardown is not None:
+        await case.teardown(state)
+    p50 = _percentile(samples, 0.5)
+    return Result(
+        case=case.name,
+        size=size,
+        p50_ms=p50 * 1000,
+        p99_ms=_percentile(samples, 0.99) * 1000,
+        throughput=items / p50 if p50 else math.inf,
+    )
+
+
+def report(results: list[Result], baselines: dict[str, dict]) -> list[str]:
+    """Print the results table and return the keys that regressed"""
+    regressions = []
+    print(
+        f"{'case':<20}{'size':>8}{'p50 ms':>12}{'p99 ms':>12}{'items/s':>14}{'vs base':>10}"
+    )
+    for result in results:
+        key = f"{result.case}@{result.size}"
+        change = ""
+        if key in baselines:
+            ratio = result.p50_ms / baselines[key]["p50_ms"] - 1
+            change = f"{ratio:+.0%}"
+            if ratio > REGRESSION_TOLERANCE:
+                change += " !"
+                regressions.append(key)
+        print(
+            f"{result.case:<20}{result.size:>8}{result.p50_ms:>12.2f}"
+            f"{result.p99_ms:>12.2f}{result.throughput:>14.0f}{change:>10}"
+        )
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    workdir = _prepare_workdir()
+    try:
+        cases = [
+            case for case in _build_cases() if not args.cases or case.name in args.cases
+        ]
+        logging.getLogger("expense-tracker-bot").setLevel(logging.WARNING)
+        results = []
+        for size in args.sizes:
+            for case in cases:
+                results.append(await measure(case, size))
+        baselines = (
+            json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {}
+        )
+        regressions = report(results, baselines)
+        if args.save_baseline:
+            baselines.update(
+                {
+                    f"{r.case}@{r.size}": {
+                        "p50_ms": round(r.p50_ms, 3),
+                        "p99_ms": round(r.p99_ms, 3),
+                        "throughput": round(r.throughput, 1),
+                    }
+                    for r in results
+                }
+            )
+            BASELINES_PATH.write_text(json.dumps(baselines, indent=2) + "\n")
+            print(f"Saved baselines to {BASELINES_PATH}")
+        if regressions:
+            print(
+                f"Regressions over {REGRESSION_TOLERANCE:.0%}: {', '.join(regressions)}"
+            )
+        return 1 if args.check and regressions else 0
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--cases", nargs="+", help="Only run these cases")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="Exit 1 on regressions")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,42 @@
+"""Stand-ins for the external services used by the benchmarks"""
+
+import re
+from types import SimpleNamespace
+from typing import Any
+
+from app.utils.movement_classifier.main import MovementClassification
+
+MOVEMENT_ID = re.compile(r"ID (\S+):")
+
+
+class StubOpenAI:
+    """Answers the structured output calls instantly, classifying every
+    movement of the prompt as groceries"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.beta = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(parse=self._parse))
+        )
+
+    async def _parse(
+        self, model: str, messages: list[dict], response_format: Any, **kwargs: Any
+    ) -> Any:
+        self.calls += 1
+        movement_ids = MOVEMENT_ID.findall(messages[-1]["content"])
+        parsed = response_format(
+            movements=[
+                MovementClassification(
+                    movement_id=movement_id,
+                    concept="Stub",
+                    category=["food", "groceries"],
+                    payment_method="card",
+                )
+                for movement_id in movement_ids
+            ]
+        )
+        return SimpleNamespace(
+            model="gpt-4o-mini",
+            usage=None,
+            choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))],
+        )
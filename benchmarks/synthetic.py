@@ -0,0 +1,252 @@
+"""Reproducible synthetic ledgers and bank statements for the benchmarks"""
+
+import random
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from app.models.expense import Expense
+from app.models.income import Income
+from app.models.movement import Movement
+
+LEDGER_END = datetime(2025, 1, 1, tzinfo=ZoneInfo("Europe/Madrid"))
+LEDGER_DAYS = 3 * 365
+STATEMENT_DAYS = 60
+
+EXPENSE_CATEGORIES = [
+    ["food", "groceries"],
+    ["food", "restaurant"],
+    ["food", "coffee"],
+    ["transportation", "vehicle", "fuel"],
+    ["transportation", "subway"],
+    ["housing", "utilities", "electricity"],
+    ["housing", "rent"],
+]
+INCOME_CATEGORIES = [["salary"], ["refunds"], ["gifts"]]
+MERCHANTS = ["Mercadona", "Repsol", "Starbucks", "Amazon", "Iberdrola", "Metro"]
+SENDERS = ["alice", "bob"]
+
+
+def _timestamp(rng: random.Random) -> datetime:
+    offset = timedelta(seconds=rng.randrange(LEDGER_DAYS * 24 * 3600))
+    return (LEDGER_END - offset).replace(microsecond=0)
+
+
+def make_expenses(n: int, seed: int = 0) -> list[Expense]:
+    rng = random.Random(seed)
+    expenses = []
+    for i in range(n):
+        merchant = rng.choice(MERCHANTS)
+        etl = rng.random() < 0.5
+        timestamp = _timestamp(rng)
+        sender = rng.choice(SENDERS)
+        cost = round(rng.uniform(1, 200), 2)
+        category = rng.choice(EXPENSE_CATEGORIES)
+        if category == ["housing", "rent"]:
+            # Above a thousand, so the sheets show it with a thousands separator
+            cost = round(cost * 10 + 800, 2)
+        expenses.append(
+            Expense(
+                expense_id=f"e{i:07d}",
+                timestamp=timestamp,
+                sender=sender,
+                cost=cost,
+                concept=merchant,
+                category=category,
+                payment_method=rng.choice(["cash", "card", "transfer", "p2p"]),
+                input_method="etl" if etl else "bot",
+                tags=["synthetic"] if rng.random() < 0.1 else None,
+                metadata={"statement_text": f"COMPRA {merchant.upper()} {i}"}
+                if etl
+                else None,
+            )
+        )
+    return expenses
+
+
+def make_incomes(n: int, seed: int = 0) -> list[Income]:
+    rng = random.Random(seed + 1)
+    return [
+        Income(
+            income_id=f"i{i:07d}",
+            timestamp=_timestamp(rng),
+            sender=rng.choice(SENDERS),
+            value=round(rng.uniform(10, 3000), 2),
+            concept="Income",
+            category=rng.choice(INCOME_CATEGORIES),
+            payment_method="transfer",
+            input_method="bot",
+        )
+        for i in range(n)
+    ]
+
+
+def make_movements(
+    expenses: list[Expense], incomes: list[Income], n: int, seed: int = 0
+) -> list[Movement]:
+    """A statement over the last STATEMENT_DAYS of the ledger.
+
+    A third of the movements match manual entries, a third are already imported
+    and the rest are new and need classification.
+    """
+    rng = random.Random(seed + 2)
+    start = LEDGER_END - timedelta(days=STATEMENT_DAYS)
+    recent = [e for e in expenses if e.timestamp >= start]
+    recent_incomes = [i for i in incomes if i.timestamp >= start]
+    movements = []
+    for i in range(n):
+        kind = i % 3
+        if kind == 0 and recent:
+            item = rng.choice(recent + recent_incomes)
+            amount = -item.cost if isinstance(item, Expense) else item.value
+            description = (item.metadata or {}).get("statement_text", f"MOV {i}")
+            day = item.timestamp.date()
+        elif kind == 1 and recent:
+            item = rng.choice(recent)
+            amount = -item.cost
+            description = (item.metadata or {}).get("statement_text", f"MOV {i}")
+            day = item.timestamp.date()
+        else:
+            amount = -round(rng.uniform(1, 200), 2)
+            description = f"COMPRA {rng.choice(MERCHANTS).upper()} NEW{i}"
+            day = (start + timedelta(days=rng.randrange(STATEMENT_DAYS))).date()
+        movements.append(
+            Movement(
+                movement_id=f"m{i:06d}",
+                date_=day,
+                date_value=day,
+                description=description,
+                amount=amount,
+                balance=0.0,
+            )
+        )
+    return movements
+
+
+# Recurring statement lines: text template, concept, category, payment method
+# and whether they are expenses. The placeholders change between movements
+STATEMENT_LINES = [
+    (
+        "COMPRA TARJ. {card} MERCADONA {branch} {city}",
+        "Mercadona",
+        ["food", "groceries"],
+        "card",
+        True,
+    ),
+    (
+        "COMPRA TARJ. {card} LIDL SUPERMERCADOS {city}",
+        "Lidl",
+        ["food", "groceries"],
+        "card",
+        True,
+    ),
+    (
+        "COMPRA TARJ. {card} STARBUCKS {branch}",
+        "Starbucks",
+        ["food", "coffee"],
+        "card",
+        True,
+    ),
+    (
+        "COMPRA TARJ. {card} REPSOL E.S. {branch} {city}",
+        "Repsol",
+        ["transportation", "vehicle", "fuel"],
+        "card",
+        True,
+    ),
+    (
+        "COMPRA TARJ. {card} CEPSA {city} {date}",
+        "Cepsa",
+        ["transportation", "vehicle", "fuel"],
+        "card",
+        True,
+    ),
+    (
+        "RECIBO IBERDROLA CLIENTES SAU REF. {reference}",
+        "Iberdrola",
+        ["housing", "utilities", "electricity"],
+        "transfer",
+        True,
+    ),
+    (
+        "TRANSFERENCIA A ALQUILERES {city} SL {date}",
+        "Rent",
+        ["housing", "rent"],
+        "transfer",
+        True,
+    ),
+    (
+        "COMPRA TARJ. {card} METRO DE {city} {date}",
+        "Metro",
+        ["transportation", "subway"],
+        "card",
+        True,
+    ),
+    (
+        "COMPRA TARJ. {card} RESTAURANTE {name} {city}",
+        "Restaurant",
+        ["food", "restaurant"],
+        "card",
+        True,
+    ),
+    ("BIZUM A {name} {reference}", "Bizum", ["food", "restaurant"], "p2p", True),
+    ("NOMINA ACME SOLUCIONES SL {reference}", "Salary", ["salary"], "transfer", False),
+    ("BIZUM DE {name} {reference}", "Bizum", ["gifts"], "p2p", False),
+    ("DEVOLUCION COMPRA TARJ. {card} AMAZON EU", "Amazon", ["refunds"], "card", False),
+]
+CITIES = ["MADRID", "VALENCIA", "SEVILLA", "BILBAO"]
+NAMES = ["ANA GARCIA", "LUIS PEREZ", "MARTA RUIZ", "JORGE SANZ"]
+
+
+def make_statement_history(n: int, seed: int = 0) -> list[Expense | Income]:
+    """Imported expenses and incomes, oldest first, with the statement text
+    they came from.
+
+    Most lines are recurring merchants with varying card numbers, branches,
+    dates and references. A tenth are one-off merchants, and 3% have a
+    different category than usual, like a manual recategorization.
+    """
+    rng = random.Random(seed + 3)
+    items: list[Expense | Income] = []
+    for i in range(n):
+        timestamp = LEDGER_END - timedelta(days=LEDGER_DAYS) * (1 - i / n)
+        if rng.random() < 0.1:
+            merchant = "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ", k=7))
+            template = f"COMPRA TARJ. {{card}} {merchant} {{city}}"
+            concept, category, method, is_expense = (
+                merchant.title(),
+                rng.choice(EXPENSE_CATEGORIES),
+                "card",
+                True,
+            )
+        else:
+            template, concept, category, method, is_expense = rng.choice(
+                STATEMENT_LINES
+            )
+        if rng.random() < 0.03:
+            category = rng.choice(
+                EXPENSE_CATEGORIES if is_expense else INCOME_CATEGORIES
+            )
+        text = template.format(
+            card=f"5540XXXXXXXX{rng.randrange(10000):04d}",
+            branch=f"{rng.randrange(1, 999):03d}",
+            city=rng.choice(CITIES),
+            date=f"{rng.randrange(1, 29):02d}/{rng.randrange(1, 13):02d}",
+            reference=f"{rng.randrange(10**9):09d}",
+            name=rng.choice(NAMES),
+        )
+        fields = dict(
+            timestamp=timestamp,
+            sender=rng.choice(SENDERS),
+            concept=concept,
+            category=category,
+            payment_method=method,
+            input_method="etl",
+            metadata={"statement_text": text},
+        )
+        amount = round(rng.uniform(1, 200), 2)
+        items.append(
+            Expense(expense_id=f"h{i:07d}", cost=amount, **fields)
+            if is_expense
+            else Income(income_id=f"h{i:07d}", value=amount, **fields)
+        )
+    return items
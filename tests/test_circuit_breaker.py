@@ -0,0 +1,69 @@
+"""The Sheets storages publish their circuit breaker state as metrics.
+
+python -m unittest discover tests
+"""
+
+import os
+import shutil
+import unittest
+
+from benchmarks.run import ROOT, _prepare_workdir
+
+WORKDIR = _prepare_workdir()
+
+from app.storage.circuit_breaker import CircuitOpenError  # noqa: E402
+from app.storage.expenses.google_sheets import GSpreadExpenseStorage  # noqa: E402
+from app.storage.fake_sheets import FakeWorksheet  # noqa: E402
+from app.utils.metrics import metrics  # noqa: E402
+
+
+def tearDownModule() -> None:
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+class CircuitMetricsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.worksheet = FakeWorksheet([["id"]])
+        self.storage = GSpreadExpenseStorage(worksheet=self.worksheet)
+        self.breaker = self.storage.circuit_breaker
+        self.labels = (("table", self.storage.TABLE_NAME),)
+
+    def state(self) -> float:
+        return metrics.gauges["sheets_circuit_state"][self.labels]
+
+    def transitions(self, state: str) -> float:
+        labels = (("state", state), *self.labels)
+        return metrics.counters["sheets_circuit_transitions_total"][labels]
+
+    async def append(self) -> None:
+        await self.storage._execute_with_retry(
+            "append_rows", idempotent=False, values=[["x"]]
+        )
+
+    async def test_gauge_starts_closed(self) -> None:
+        self.assertEqual(self.state(), 0)
+
+    async def test_open_and_close_again(self) -> None:
+        opened = self.transitions("open")
+        closed = self.transitions("closed")
+        self.worksheet.fail_next(503, count=self.breaker.failure_threshold)
+        for _ in range(self.breaker.failure_threshold):
+            with self.assertRaises(Exception):
+                await self.append()
+        self.assertEqual(self.state(), 2)
+        self.assertEqual(self.transitions("open"), opened + 1)
+        with self.assertRaises(CircuitOpenError):
+            await self.append()
+
+        self.breaker.reset_timeout = 0
+        await self.append()
+        self.assertEqual(self.state(), 0)
+        self.assertEqual(self.transitions("closed"), closed + 1)
+        self.assertIn(
+            'sheets_circuit_state{table="expenses"} 0', metrics.render().splitlines()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
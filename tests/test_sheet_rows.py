@@ -0,0 +1,79 @@
+"""Updates land on the right sheet rows when the sheet has gaps.
+
+python -m unittest discover tests
+"""
+
+import os
+import shutil
+import unittest
+
+from benchmarks.run import ROOT, _prepare_workdir
+
+WORKDIR = _prepare_workdir()
+
+from app.storage.expenses.google_sheets import GSpreadExpenseStorage  # noqa: E402
+from app.storage.fake_sheets import FakeWorksheet  # noqa: E402
+from benchmarks.synthetic import make_expenses  # noqa: E402
+
+
+def tearDownModule() -> None:
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+class SheetRowsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        encoder = GSpreadExpenseStorage(worksheet=FakeWorksheet())
+        self.header = list(encoder.MODEL.model_fields)
+        self.rows = [encoder._item_to_row(expense) for expense in make_expenses(40)]
+
+    async def start(self, rows: list[list]) -> GSpreadExpenseStorage:
+        self.worksheet = FakeWorksheet([self.header] + rows)
+        storage = GSpreadExpenseStorage(worksheet=self.worksheet)
+        await storage.start()
+        self.addAsyncCleanup(storage.close)
+        return storage
+
+    async def rename(self, storage: GSpreadExpenseStorage, expense_id: str) -> None:
+        expense = await storage.get_expense(expense_id)
+        assert expense is not None
+        await storage.update_expense(expense.model_copy(update={"concept": "Renamed"}))
+        await storage.flush()
+
+    def sheet(self) -> dict[str, list[str]]:
+        """Data rows by id, failing on duplicated ids"""
+        rows = [row for row in self.worksheet.rows[1:] if any(row)]
+        by_id = {row[0]: row for row in rows}
+        self.assertEqual(len(by_id), len(rows), "an id appears in several rows")
+        return by_id
+
+    async def test_blank_row_in_the_middle(self) -> None:
+        storage = await self.start(self.rows[:10] + [[]] + self.rows[10:])
+        await self.rename(storage, "e0000020")
+        sheet = self.sheet()
+        self.assertEqual(len(sheet), 40)
+        self.assertEqual(sheet["e0000020"][self.header.index("concept")], "Renamed")
+        self.assertEqual(sheet["e0000019"], [str(v) for v in self.rows[19]])
+
+    async def test_blank_row_added_after_load(self) -> None:
+        storage = await self.start(self.rows)
+        self.worksheet.rows.insert(30, [])
+        await storage.sync_cache()
+        await self.rename(storage, "e0000035")
+        sheet = self.sheet()
+        self.assertEqual(len(sheet), 40)
+        self.assertEqual(sheet["e0000035"][self.header.index("concept")], "Renamed")
+        self.assertEqual(len(await storage.get_expenses()), 40)
+
+    async def test_row_deleted_after_load(self) -> None:
+        storage = await self.start(self.rows)
+        del self.worksheet.rows[11]  # e0000010
+        await self.rename(storage, "e0000020")
+        sheet = self.sheet()
+        self.assertEqual(len(sheet), 39)
+        self.assertEqual(sheet["e0000020"][self.header.index("concept")], "Renamed")
+        self.assertEqual(sheet["e0000021"], [str(v) for v in self.rows[21]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Streamed replies stay within Telegram's message length once escaped.
+
+python -m unittest discover tests
+"""
+
+import os
+import shutil
+import time
+import unittest
+from typing import Any
+
+from benchmarks.run import ROOT, _prepare_workdir
+
+WORKDIR = _prepare_workdir()
+
+from app.bot.streaming import MAX_MESSAGE_LENGTH, StreamingReply  # noqa: E402
+from app.bot.utils import escape_telegram_markdown, split_message  # noqa: E402
+
+# Every "." and "-" doubles once escaped
+LONG_ANSWER = "\n".join(f"{i}. Groceries - 12.50 EUR" for i in range(600))
+
+
+def tearDownModule() -> None:
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+class FakeMessage:
+    """Records the texts sent to and edited into a chat"""
+
+    def __init__(self, sent: list[str] | None = None):
+        self.sent = [] if sent is None else sent
+        self.text = ""
+
+    async def reply_text(self, text: str, **kwargs: Any) -> "FakeMessage":
+        assert len(text) <= MAX_MESSAGE_LENGTH, len(text)
+        reply = FakeMessage(self.sent)
+        reply.text = text
+        self.sent.append(text)
+        return reply
+
+    async def edit_text(self, text: str, **kwargs: Any) -> None:
+        assert len(text) <= MAX_MESSAGE_LENGTH, len(text)
+        self.text = text
+
+
+class SplitMessageTest(unittest.TestCase):
+    def test_parts_fit_once_escaped(self) -> None:
+        parts = split_message(LONG_ANSWER, MAX_MESSAGE_LENGTH)
+        self.assertGreater(len(parts), 1)
+        self.assertEqual("".join(parts), LONG_ANSWER)
+        for part in parts:
+            self.assertLessEqual(
+                len(escape_telegram_markdown(part)), MAX_MESSAGE_LENGTH
+            )
+            self.assertTrue(part.endswith("\n") or part is parts[-1])
+
+    def test_short_text_is_one_part(self) -> None:
+        self.assertEqual(split_message("Hi.", MAX_MESSAGE_LENGTH), ["Hi."])
+
+
+class StreamingReplyTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.message = FakeMessage()
+        self.reply = StreamingReply(self.message, time.monotonic(), edit_interval=0)
+        await self.reply.start()
+
+    async def test_partial_text_is_cut_after_escaping(self) -> None:
+        await self.reply.on_text(LONG_ANSWER)
+        assert self.reply._editor is not None
+        await self.reply._editor
+        self.assertTrue(self.reply._reply.text.startswith("0\\. Groceries"))  # type: ignore
+
+    async def test_long_answer_continues_in_follow_ups(self) -> None:
+        await self.reply.finish(LONG_ANSWER)
+        parts = split_message(LONG_ANSWER, MAX_MESSAGE_LENGTH)
+        self.assertEqual(
+            self.reply._reply.text,  # type: ignore
+            escape_telegram_markdown(parts[0]),
+        )
+        self.assertEqual(
+            self.message.sent[1:], [escape_telegram_markdown(p) for p in parts[1:]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()